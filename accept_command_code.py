@@ -1,6 +1,4 @@
 import discord
-import json
-import os
 from log_helper import add_log
 
 class AcceptModal(discord.ui.Modal, title="Accept Appeal"):
@@ -13,22 +11,14 @@ class AcceptModal(discord.ui.Modal, title="Accept Appeal"):
 
     async def on_submit(self, interaction: discord.Interaction):
         try:
-            # Load config to get main server
-            config_file = 'config.json'
-            if os.path.exists(config_file):
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-            else:
-                await interaction.response.send_message("Config file not found.", ephemeral=True)
-                return
-
-            main_server_id = config.get('main_server')
+            # Main server from the shared config service (no file read per click)
+            main_server_id = config.main_server
             if not main_server_id:
                 await interaction.response.send_message("Main server ID not configured in config.json.", ephemeral=True)
                 return
 
             # Get the main server
-            guild = client.get_guild(int(main_server_id))
+            guild = client.get_guild(main_server_id)
             if not guild:
                 await interaction.response.send_message(f"Could not find main server with ID {main_server_id}.", ephemeral=True)
                 return
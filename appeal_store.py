@@ -0,0 +1,193 @@
+# appeal_store.py
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from persistence import get_worker
+
+APPEALS_FILE = "appeals.json"
+
+
+def _key(user_id, log_id) -> Tuple[str, str]:
+    return str(user_id), str(log_id)
+
+
+class AppealStore:
+    """
+    Pending appeals keyed by (user_id, log_id), with a secondary index by thread_id.
+    Every mutation happens under one lock, so the Flask thread and the bot loop
+    can't lose each other's updates; the file is written behind by the
+    persistence worker from a snapshot taken under the same lock.
+    Returned appeals are copies; change them through update().
+    """
+
+    def __init__(self, path: str = APPEALS_FILE):
+        self.path = path
+        self._lock = threading.RLock()
+        self._appeals: Dict[Tuple[str, str], Dict] = {}   # oldest first
+        self._by_thread: Dict[str, Tuple[str, str]] = {}
+        self._signature = None
+        self._version = 0          # bumped on every mutation
+        self._persisting = 0       # version captured by the pending snapshot
+        self._persisted = 0        # version known to be on disk
+        self._changes = 0          # also counts reloads after another writer; see version()
+        self._changed_at = time.time()
+        self._load()
+
+    # -- disk -------------------------------------------------------------
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _load(self) -> None:
+        appeals = []
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    appeals = json.load(f)
+            except Exception as e:
+                logging.error(f"Error loading {self.path}: {e}")
+        self._appeals.clear()
+        self._by_thread.clear()
+        for appeal in reversed(appeals):          # file is newest first
+            self._index(appeal)
+        self._signature = self._stat()
+        self._changes += 1
+        self._changed_at = time.time()
+
+    def _refresh(self) -> None:
+        if self._persisted != self._version:
+            return                 # memory is ahead of disk until the write lands
+        if self._stat() != self._signature:
+            self._load()
+
+    def _save(self) -> None:
+        self._version += 1
+        self._changes += 1
+        self._changed_at = time.time()
+        get_worker().write_json(self.path, self._persist_snapshot, self._on_written)
+
+    def _persist_snapshot(self) -> List[Dict]:
+        with self._lock:
+            self._persisting = self._version
+            return self._snapshot()
+
+    def _on_written(self) -> None:
+        with self._lock:
+            self._persisted = self._persisting
+            self._signature = self._stat()
+
+    def _snapshot(self) -> List[Dict]:
+        return [dict(a) for a in reversed(self._appeals.values())]
+
+    def _index(self, appeal: Dict) -> None:
+        key = _key(appeal.get("user_id"), appeal.get("log_id"))
+        self._unindex(key)
+        self._appeals[key] = appeal
+        if appeal.get("thread_id"):
+            self._by_thread[str(appeal["thread_id"])] = key
+
+    def _unindex(self, key) -> Optional[Dict]:
+        old = self._appeals.pop(key, None)
+        if old and old.get("thread_id"):
+            self._by_thread.pop(str(old["thread_id"]), None)
+        return old
+
+    # -- queries ----------------------------------------------------------
+
+    def version(self) -> Tuple[int, float]:
+        """(change counter, time of the last change), for cache validation."""
+        with self._lock:
+            self._refresh()
+            return self._changes, self._changed_at
+
+    def all(self) -> List[Dict]:
+        """Every pending appeal, newest first."""
+        with self._lock:
+            self._refresh()
+            return self._snapshot()
+
+    def get(self, user_id, log_id) -> Optional[Dict]:
+        with self._lock:
+            self._refresh()
+            appeal = self._appeals.get(_key(user_id, log_id))
+            return dict(appeal) if appeal else None
+
+    def get_by_thread(self, thread_id) -> Optional[Dict]:
+        with self._lock:
+            self._refresh()
+            key = self._by_thread.get(str(thread_id))
+            return dict(self._appeals[key]) if key else None
+
+    # -- mutations --------------------------------------------------------
+
+    def upsert(self, appeal: Dict) -> Dict:
+        """
+        Add an appeal, or merge it into the existing one for the same user and
+        log (fields it doesn't set, like thread_id, are kept) and move that to the top.
+        """
+        with self._lock:
+            self._refresh()
+            existing = self._appeals.get(_key(appeal.get("user_id"), appeal.get("log_id")))
+            appeal = dict(existing or {}, **appeal)
+            self._index(appeal)
+            self._save()
+            return dict(appeal)
+
+    def update(self, user_id, log_id, **fields) -> Optional[Dict]:
+        """Set *fields* on an existing appeal in place. Returns None if there is no such appeal."""
+        with self._lock:
+            self._refresh()
+            key = _key(user_id, log_id)
+            appeal = self._appeals.get(key)
+            if appeal is None:
+                return None
+            if appeal.get("thread_id"):
+                self._by_thread.pop(str(appeal["thread_id"]), None)
+            appeal.update(fields)
+            if appeal.get("thread_id"):
+                self._by_thread[str(appeal["thread_id"])] = key
+            self._save()
+            return dict(appeal)
+
+    def delete(self, user_id, log_id) -> Optional[Dict]:
+        """Remove an appeal. Returns the removed appeal, or None if it didn't exist."""
+        with self._lock:
+            self._refresh()
+            removed = self._unindex(_key(user_id, log_id))
+            if removed is not None:
+                self._save()
+            return removed
+
+    def delete_many(self, keys: List[Tuple]) -> List[Optional[Dict]]:
+        """Remove several (user_id, log_id) appeals with a single save. Results follow *keys*."""
+        with self._lock:
+            self._refresh()
+            removed = [self._unindex(_key(user_id, log_id)) for user_id, log_id in keys]
+            if any(r is not None for r in removed):
+                self._save()
+            return removed
+
+
+_store: Optional[AppealStore] = None
+
+
+def set_store(store) -> None:
+    """Swap the repository (bot.py picks sqlite_store.SqliteAppealStore for "storage": "sqlite")."""
+    global _store
+    _store = store
+
+
+def get_store() -> AppealStore:
+    """The process-wide appeals repository shared by bot.py and moderation.py."""
+    global _store
+    if _store is None:
+        _store = AppealStore()
+    return _store
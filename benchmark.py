@@ -0,0 +1,291 @@
+# benchmark.py
+"""
+Storage and route benchmarks on synthetic data.
+
+    python benchmark.py                              # 1k, 10k, 100k entries
+    python benchmark.py --sizes 1000,1000000 --output bench.json
+    python benchmark.py --compare bench.json         # diff against an earlier run
+
+Each dataset size runs in its own child process and scratch directory: a
+legacy logs.json (migrated on load, like a real upgrade) and appeals.json
+are generated, bot.py is imported with its Discord client stubbed (no
+token, no network), and the helpers and Flask routes are driven through
+app.test_client(). Results are JSON: latency percentiles in ms per
+operation, plus peak Python allocation and process RSS.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = "1000,10000,100000"
+TEMPLATES = ("dashboard.html", "logs.html", "appeals.html", "appeal_case.html", "login.html")
+BENCH_PASSWORD = "benchmark"
+
+WORDS = ("spam", "raid", "slur", "nsfw", "alt", "account", "advertising", "harassment", "toxic",
+         "evading", "scam", "link", "phishing", "bot", "threats", "doxxing", "impersonation")
+TYPES = ("ban", "kick", "unban", "unkick")
+
+
+# -- dataset ------------------------------------------------------------------
+
+def generate(directory: str, size: int, appeals: int, users: int, seed: int) -> None:
+    """Write logs.json (newest first, like the old format) and appeals.json."""
+    rng = random.Random(seed)
+    month = datetime.now().strftime("%Y-%m")
+    user_ids = [str(10 ** 17 + rng.randrange(10 ** 12)) for _ in range(users)]
+    logs = []
+    for i in range(1, size + 1):
+        logs.append({
+            "id": str(i),
+            "type": rng.choice(TYPES),
+            "user_id": rng.choice(user_ids),
+            "reason": " ".join(rng.choices(WORDS, k=rng.randint(2, 8))),
+            "timestamp": f"{month}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+        })
+    logs.reverse()
+    with open(os.path.join(directory, "logs.json"), "w", encoding="utf-8") as f:
+        json.dump(logs, f)
+
+    pending = []
+    for log in rng.sample(logs, min(appeals, len(logs))):
+        pending.append({"log_id": log["id"], "user_id": log["user_id"], "text": "please",
+                        "timestamp": log["timestamp"]})
+    with open(os.path.join(directory, "appeals.json"), "w", encoding="utf-8") as f:
+        json.dump(pending, f)
+
+    with open(os.path.join(directory, "config.json"), "w", encoding="utf-8") as f:
+        json.dump({"token": "", "log_channel_id": "", "custom_commands": {}}, f)
+    with open(os.path.join(directory, "passwd.json"), "w", encoding="utf-8") as f:
+        json.dump({"password": BENCH_PASSWORD}, f)
+    for name in TEMPLATES:
+        shutil.copy(os.path.join(HERE, name), directory)
+
+
+# -- measurement --------------------------------------------------------------
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def measure(fn, iterations: int, budget: float, memory_runs: int = 3) -> dict:
+    """
+    Call fn(i) up to *iterations* times or until *budget* seconds pass (at least once).
+    Latencies are taken with tracemalloc off; peak allocation comes from a few extra calls.
+    """
+    samples = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - t) * 1000)
+        if time.perf_counter() - started > budget:
+            break
+
+    tracemalloc.start()
+    for i in range(memory_runs):
+        fn(len(samples) + i)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "n": len(samples),
+        "mean_ms": round(sum(samples) / len(samples), 4),
+        "p50_ms": round(_percentile(samples, 50), 4),
+        "p90_ms": round(_percentile(samples, 90), 4),
+        "p99_ms": round(_percentile(samples, 99), 4),
+        "max_ms": round(max(samples), 4),
+        "peak_alloc_kb": peak // 1024,
+    }
+
+
+def _max_rss_kb():
+    try:
+        import resource
+    except ImportError:                 # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def _stub_bot(bot_module):
+    """Give the Discord client a private loop and instant, network-free lookups."""
+    import asyncio
+    import threading
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    client = bot_module.bot
+    client.loop = loop
+
+    async def resolve_users(user_ids, timeout=None, concurrency=None):
+        return {str(uid): f"user{str(uid)[-4:]}" for uid in user_ids}
+
+    client.resolve_users = resolve_users
+
+
+def run_size(directory: str, size: int, iterations: int, budget: float, seed: int) -> dict:
+    """Child process body: everything here runs inside the generated scratch directory."""
+    os.chdir(directory)
+    sys.path.insert(0, HERE)
+    rng = random.Random(seed)
+    import discord, flask               # noqa: F401 – keep library imports out of load_s
+
+    tracemalloc.start()
+    t = time.perf_counter()
+    import bot as bot_module            # opens (and migrates) the stores in cwd
+    import log_helper
+    import persistence
+    log_helper.get_logs()               # build the index up front
+    load_seconds = time.perf_counter() - t
+    _, load_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    _stub_bot(bot_module)
+    client = bot_module.app.test_client()
+    admin = bot_module.app.test_client()
+    with admin.session_transaction() as session:
+        session["logged_in"] = True
+
+    ids = [str(rng.randint(1, size)) for _ in range(iterations)]
+    appeals = bot_module.appeal_store.all()
+
+    def dismiss(i):
+        appeal = appeals[i % len(appeals)] if appeals else {"user_id": "0", "log_id": "0"}
+        admin.post("/dismiss_appeal", data={"user_id": appeal["user_id"], "log_id": appeal["log_id"]})
+
+    benchmarks = {
+        "add_log": lambda i: log_helper.add_log({"type": "ban", "user_id": "1", "reason": "bench",
+                                                 "timestamp": "2000-01-01 00:00:00"}),
+        "get_log": lambda i: log_helper.get_log(ids[i % len(ids)]),
+        "search_logs": lambda i: log_helper.search_logs(rng.choice(WORDS)),
+        "route_logs": lambda i: client.get("/logs"),
+        "route_logs_search": lambda i: client.get("/logs", query_string={"search": rng.choice(WORDS) + " type:ban"}),
+        "route_submit_appeal": lambda i: client.post("/submit_appeal",
+                                                     data={"log_id": ids[i % len(ids)], "appeal_text": "bench"}),
+        "route_dismiss_appeal": dismiss,
+    }
+    results = {name: measure(fn, iterations, budget) for name, fn in benchmarks.items()}
+
+    t = time.perf_counter()
+    persistence.flush(timeout=None)
+    return {
+        "size": size,
+        "appeals": len(appeals),
+        "load_s": round(load_seconds, 3),
+        "load_peak_alloc_kb": load_peak // 1024,
+        "flush_s": round(time.perf_counter() - t, 3),
+        "max_rss_kb": _max_rss_kb(),
+        "benchmarks": results,
+    }
+
+
+# -- driver -------------------------------------------------------------------
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(old: dict, new: dict, threshold: float) -> int:
+    """Print p50/p99 ratios new/old; returns how many operations regressed past *threshold*."""
+    before = {(r["size"], name): stats for r in old["results"] for name, stats in r["benchmarks"].items()}
+    regressions = 0
+    print(f"{'size':>9} {'operation':<22} {'p50 old':>10} {'p50 new':>10} {'ratio':>7} {'p99 ratio':>9}", file=sys.stderr)
+    for result in new["results"]:
+        for name, stats in result["benchmarks"].items():
+            base = before.get((result["size"], name))
+            if not base:
+                continue
+            ratio = stats["p50_ms"] / base["p50_ms"] if base["p50_ms"] else float("inf")
+            ratio99 = stats["p99_ms"] / base["p99_ms"] if base["p99_ms"] else float("inf")
+            flag = "  <-- slower" if ratio > threshold else ""
+            regressions += bool(flag)
+            print(f"{result['size']:>9} {name:<22} {base['p50_ms']:>10.3f} {stats['p50_ms']:>10.3f} "
+                  f"{ratio:>7.2f} {ratio99:>9.2f}{flag}", file=sys.stderr)
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark log/appeal storage and dashboard routes")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma-separated log counts (default {DEFAULT_SIZES})")
+    parser.add_argument("--appeals", type=float, default=0.1, help="appeals per log entry (default 0.1)")
+    parser.add_argument("--users", type=int, default=5000, help="distinct user ids in the dataset")
+    parser.add_argument("--iterations", type=int, default=200, help="calls per operation")
+    parser.add_argument("--budget", type=float, default=10.0, help="max seconds per operation per size")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="p50 ratio counted as a regression")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directories")
+    parser.add_argument("--child", nargs=2, metavar=("DIR", "SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        directory, size = args.child[0], int(args.child[1])
+        print(json.dumps(run_size(directory, size, args.iterations, args.budget, args.seed)))
+        return 0
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "budget_s": args.budget,
+            "seed": args.seed,
+        },
+        "results": [],
+    }
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        directory = tempfile.mkdtemp(prefix=f"modbot-bench-{size}-")
+        try:
+            t = time.perf_counter()
+            generate(directory, size, int(size * args.appeals), args.users, args.seed)
+            print(f"[{size}] dataset ready in {time.perf_counter() - t:.1f}s ({directory})", file=sys.stderr)
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", directory, str(size),
+                 "--iterations", str(args.iterations), "--budget", str(args.budget), "--seed", str(args.seed)],
+                capture_output=True, text=True)
+            if child.returncode != 0:
+                print(child.stderr, file=sys.stderr)
+                raise SystemExit(f"benchmark for {size} entries failed")
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            report["results"].append(result)
+            print(f"[{size}] load {result['load_s']}s, "
+                  + ", ".join(f"{k} p50={v['p50_ms']}ms" for k, v in result["benchmarks"].items()), file=sys.stderr)
+        finally:
+            if not args.keep:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            return 1 if compare(json.load(f), report, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,29 +1,51 @@
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 import threading
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Response, g, make_response, render_template, stream_template, request, jsonify, session, redirect, url_for
 from functools import wraps
 import json
 import os
 import asyncio
+import concurrent.futures
+import itertools
 import logging
-from typing import Optional
+import time
+from typing import Optional, Tuple
 from datetime import datetime
-import subprocess
+import builtins
 
 
 # external variables
-from log_helper import add_log, get_log
-from moderation import accept_command, perform_accept_action, notify_user_of_appeal
+from log_helper import (add_log, get_log, search_logs, set_store as set_log_store,
+                        rotate_logs, compact_logs, index_usernames, unindex_username,
+                        iter_logs, page_logs, ndjson_chunks, PAGE_SIZE as LOGS_PAGE_SIZE)
+from log_store import open_store as open_log_store
+from moderation import accept_command, submit_appeal as file_appeal, bulk_request_error
+from user_cache import UserCache, USER_CACHE_FILE
+import script_cache
+from sync_scheduler import SyncScheduler
+from appeal_store import get_store as get_appeal_store, set_store as set_appeal_store
+from sqlite_store import get_database, SqliteLogStore, SqliteAppealStore, SqliteCommandStore, DATABASE_FILE
+from bot_ipc import CALLS as BOT_CALLS, BOT_SOCKET, BotClient, BotUnavailable, IPCServer
+from config_service import get_config
+import persistence
+import metrics
+from jobs import JobManager, sse_stream, sse_poll_stream
+from page_cache import Page, page_cache, check as page_check
+from single_flight import SingleFlight
+from gateway_cache import client_options, wants_lazy_chunking, chunk_lazily
+from loop_watchdog import LoopWatchdog, configure_pool as configure_script_pool, run_blocking
+from request_scheduler import RequestScheduler, request_priority, BACKGROUND
+from moderation_events import ModerationEventIngest
 
 
 logging.basicConfig(level=logging.INFO)
 
-CONFIG_FILE = 'config.json'
-LOGS_FILE = 'logs.json'
 PASS_FILE = 'passwd.json'
-APPEALS_FILE = 'appeals.json'
+
+# Overall deadline for resolving every username shown on one /logs page
+RESOLVE_DEADLINE = 3.0
 
 # Configuration Management
 def load_json_file(filename, default):
@@ -38,87 +60,263 @@ def load_json_file(filename, default):
         logging.error(f"Error loading {filename}: {e}")
         return default
 
-def save_json_file(filename, data):
-    import tempfile
-    import os
-    try:
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json', dir=os.path.dirname(filename), encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
-            temp_name = f.name
-        os.replace(temp_name, filename)
-    except Exception as e:
-        logging.error(f"Error saving {filename}: {e}")
-        if 'temp_name' in locals():
-            try:
-                os.unlink(temp_name)
-            except:
-                pass
-
-config = load_json_file(CONFIG_FILE, {"token": "", "log_channel_id": "", "custom_commands": {}})
+config = get_config()
 pass_config = load_json_file(PASS_FILE, {"password"})
+# Log and appeal writes are batched; this is how much a hard crash can lose
+persistence.get_worker().configure(window=config.get('persistence_window', 0.5),
+                                   fsync=config.get('persistence_fsync', False))
+# "storage": "sqlite" keeps logs, appeals and custom commands in one WAL database that
+# several processes can write at once; the default is the JSON files
+if config.get('storage', 'files') == 'sqlite':
+    database = get_database(config.get('database', DATABASE_FILE))
+    set_log_store(SqliteLogStore(database))
+    set_appeal_store(SqliteAppealStore(database))
+    config.use_command_store(SqliteCommandStore(database, initial=config.custom_commands))
+else:
+    set_log_store(open_log_store(config.get('log_store', 'jsonl')))
+appeal_store = get_appeal_store()
+
+# MODBOT_ROLE=dashboard: this process only serves the Flask app (e.g. as one of several
+# gunicorn workers) and asks the bot process for Discord actions over bot_socket
+DASHBOARD_WORKER = os.environ.get('MODBOT_ROLE') == 'dashboard'
+if DASHBOARD_WORKER and config.get('storage') != 'sqlite':
+    raise RuntimeError('MODBOT_ROLE=dashboard needs "storage": "sqlite" in config.json')
+bot_client = BotClient(config.get('bot_socket') or BOT_SOCKET) if DASHBOARD_WORKER else None
+configure_script_pool(config.get('script_pool_workers', 4))
+
+# Globals every dynamic command script sees (built once, shallow-copied per run)
+SCRIPT_GLOBALS = {
+    '__builtins__': builtins,
+    'discord': discord,
+    'app_commands': app_commands,
+    'commands': commands,
+    'asyncio': asyncio,
+    'json': json,
+    'os': os,
+    'logging': logging,
+    'datetime': datetime,
+    'add_log': add_log,
+    'get_log': get_log,
+    'run_blocking': run_blocking,
+    'config': config,
+}
 
 # Bot Setup
-class DiscordBot(commands.Bot):
+# auto_shard: one process runs every shard Discord recommends (or shard_count)
+BotBase = commands.AutoShardedBot if config.get('auto_shard', False) else commands.Bot
+
+class DiscordBot(BotBase):
     def __init__(self):
         intents = discord.Intents.default()
         intents.members = True
         intents.message_content = True
-        super().__init__(command_prefix="!", intents=intents)
-        self.user_cache = {}
+        super().__init__(command_prefix="!", intents=intents, **client_options(config, intents))
+        self._lazy_chunker = None
+        self.user_cache = UserCache(on_evict=unindex_username)     # /logs name search mirrors the cache
+        self.user_cache.load(USER_CACHE_FILE)
+        index_usernames(self.user_cache.names())
+        self.command_errors = {}  # name -> compile error from the last load
+        self.sync_scheduler = SyncScheduler(self)
+        self.jobs = JobManager(self)
+        self.watchdog = LoopWatchdog(threshold=config.get('loop_stall_threshold', 0.25))
+        # Concurrent fetches of one id share a single API call; results are reused briefly
+        fetch_ttl = config.get('fetch_cache_ttl', 30)
+        self._user_fetches = SingleFlight("user", super().fetch_user, ttl=fetch_ttl)
+        self._channel_fetches = SingleFlight("channel", super().fetch_channel, ttl=fetch_ttl)
+        # Outbound API calls queue per priority class; moderation goes first
+        self.request_scheduler = RequestScheduler(config.get('request_concurrency'))
+        # Bans/kicks/timeouts done outside the bot, logged in batches
+        main_server = str(config.get('main_server') or '')
+        self.moderation_events = ModerationEventIngest(
+            guild_id=int(main_server) if main_server.isdigit() else None,
+            window=config.get('moderation_event_window', 2.0),
+            max_queue=config.get('moderation_event_queue', 1000),
+            dedupe_window=config.get('moderation_event_dedupe', 30))
+        self._count_http_requests()
+
+    async def fetch_user(self, user_id, /):
+        return await self._user_fetches.get(int(user_id))
+
+    async def fetch_channel(self, channel_id, /):
+        return await self._channel_fetches.get(int(channel_id))
+
+    def fetch_stats(self) -> dict:
+        return {"user": self._user_fetches.stats(), "channel": self._channel_fetches.stats()}
+
+    def _count_http_requests(self):
+        # Every REST call (fetch_user, fetch_channel, sends, bans...) goes through http.request
+        request = self.http.request
+
+        async def counted_request(route, **kwargs):
+            labels = {"method": route.method, "route": route.path}
+            status = "error"
+            try:
+                async with self.request_scheduler.slot():
+                    with metrics.DISCORD_SECONDS.time(**labels):
+                        result = await request(route, **kwargs)
+                status = "ok"
+                return result
+            except discord.HTTPException as e:
+                status = str(e.status)
+                raise
+            finally:
+                metrics.DISCORD_REQUESTS.inc(status=status, **labels)
+
+        self.http.request = counted_request
 
     async def setup_hook(self):
-        for name, script in config.get('custom_commands', {}).items():
+        for name, script in config.custom_commands.items():
             try:
                 self.create_dynamic_command(name, script)
             except Exception as e:
+                self.command_errors[name] = str(e)
                 logging.error(f"Failed to load command {name}: {e}")
         # Add accept command
         self.tree.add_command(accept_command)
-        await self.tree.sync()
+        await self.sync_scheduler.sync_now()
+        self.watchdog.start()
+        self.snapshot_user_cache.start()
+        self.rotate_log_segments.start()
+        if config.get('ingest_moderation_events', True):
+            self.moderation_events.start()
+
+    async def on_ready(self):
+        # chunk_members "lazy": fill the member cache after startup instead of before it
+        if wants_lazy_chunking(config, self._connection.member_cache_flags) and self._lazy_chunker is None:
+            self._lazy_chunker = asyncio.create_task(chunk_lazily(self))
+
+    async def on_audit_log_entry_create(self, entry):
+        await self.moderation_events.audit_entry(entry)
+
+    async def on_member_ban(self, guild, user):
+        await self.moderation_events.member_event("ban", guild, user)
+
+    async def on_member_unban(self, guild, user):
+        await self.moderation_events.member_event("unban", guild, user)
+
+    async def close(self):
+        self.watchdog.stop()
+        await self.moderation_events.stop()
+        self.user_cache.save(USER_CACHE_FILE)
+        await super().close()
+
+    @tasks.loop(minutes=10)
+    async def snapshot_user_cache(self):
+        # Keeps a warm cache for the next start even if we die without close()
+        await asyncio.to_thread(self.user_cache.save, USER_CACHE_FILE)
+
+    @tasks.loop(hours=1)
+    async def rotate_log_segments(self):
+        # First run is at startup; afterwards this only does work at a month boundary
+        try:
+            await asyncio.to_thread(rotate_logs)
+        except Exception as e:
+            logging.error(f"Log rotation failed: {e}")
+
+    def _cached_name(self, user_id: int) -> Tuple[bool, Optional[str]]:
+        # Check local cache first (a cached None is a known-missing user)
+        found, name = self.user_cache.get(user_id)
+        if found:
+            return True, name
 
-    async def resolve_user(self, user_id):
-        user_id = int(user_id)
-        # Check local cache first
-        if user_id in self.user_cache:
-            return self.user_cache[user_id]
-        
         # Check bot cache
         user = self.get_user(user_id)
         if user:
-            self.user_cache[user_id] = user.name
-            return user.name
+            self._remember_name(user_id, user.name)
+            return True, user.name
+        return False, None
+
+    def names_pending(self, user_ids, resolved: dict) -> bool:
+        """True if some of *user_ids* are neither in *resolved* nor known (found or missing) to the cache."""
+        return any(uid not in resolved and uid.isdigit() and int(uid) not in self.user_cache for uid in user_ids)
+
+    def _remember_name(self, user_id: int, name: str) -> None:
+        self.user_cache.put(user_id, name)
+        index_usernames({user_id: name})        # lets /logs search by name
+
+    async def _fetch_name(self, user_id: int) -> Optional[str]:
+        try:
+            # Names are cosmetic: don't compete with moderation actions for the API
+            with request_priority(BACKGROUND):
+                user = await self.fetch_user(user_id)
+        except discord.NotFound:
+            self.user_cache.put_missing(user_id)
+            return None
+        self._remember_name(user_id, user.name)
+        return user.name
+
+    async def resolve_user(self, user_id):
+        user_id = int(user_id)
+        found, name = self._cached_name(user_id)
+        if found:
+            return name
 
         # Fetch from API (fallback)
         try:
-            user = await self.fetch_user(user_id)
-            self.user_cache[user_id] = user.name
-            return user.name
+            return await self._fetch_name(user_id)
         except:
             return None
 
+    async def resolve_users(self, user_ids, timeout: float = RESOLVE_DEADLINE, concurrency: int = 10) -> dict:
+        """
+        Resolve many user ids in one go. Cache misses are fetched concurrently
+        (at most *concurrency* at a time); whatever has not finished after
+        *timeout* seconds is dropped, so the result may be partial.
+        Returns {str(user_id): username}.
+        """
+        names = {}
+        misses = []
+        for raw_id in set(user_ids):
+            try:
+                user_id = int(raw_id)
+            except (TypeError, ValueError):
+                continue
+            found, name = self._cached_name(user_id)
+            if not found:
+                misses.append(user_id)
+            elif name:
+                names[str(user_id)] = name
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _fetch(user_id):
+            async with semaphore:
+                try:
+                    name = await self._fetch_name(user_id)
+                except Exception:
+                    return
+                if name:
+                    names[str(user_id)] = name
+
+        tasks = [asyncio.create_task(_fetch(user_id)) for user_id in misses]
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+        return names
+
     def create_dynamic_command(self, name, script):
+        # Compile first: a SyntaxError leaves the existing command untouched
+        code = script_cache.compile_script(script, name)
+        self.command_errors.pop(name, None)
+
         existing = self.tree.get_command(name)
         if existing:
             self.tree.remove_command(name)
 
         async def dynamic_callback(interaction: discord.Interaction):
-            local_vars = {
-                'interaction': interaction, 
-                'client': self, 
-                'discord': discord,
-                'app_commands': app_commands
-            }
-            exec_globals = globals().copy()
-            exec_globals.update(local_vars)
-            try:
-                indented_script = "\n    ".join(script.splitlines())
-                exec_code = f"async def _eval_coro(interaction, client, discord, app_commands):\n    {indented_script}"
-                exec(exec_code, exec_globals)
-                await exec_globals['_eval_coro'](interaction, self, discord, app_commands)
-            except Exception as e:
-                if not interaction.response.is_done():
-                    await interaction.response.send_message(f"Execution Error: {e}", ephemeral=True)
-                logging.error(f"Dynamic command error ({name}): {e}")
+            exec_globals = dict(SCRIPT_GLOBALS)
+            exec_globals['client'] = self
+            exec_globals['__name__'] = f'<command {name}>'      # for logging.getLogger(__name__), class __module__
+            with metrics.COMMAND_SECONDS.time(command=name), self.watchdog.running(name):
+                try:
+                    _eval_coro = script_cache.make_function(code, exec_globals)
+                    await _eval_coro(interaction, self, discord, app_commands)
+                except Exception as e:
+                    metrics.COMMAND_ERRORS.inc(command=name)
+                    if not interaction.response.is_done():
+                        await interaction.response.send_message(f"Execution Error: {e}", ephemeral=True)
+                    logging.error(f"Dynamic command error ({name}): {e}")
 
         new_command = app_commands.Command(
             name=name,
@@ -127,6 +325,29 @@ class DiscordBot(commands.Bot):
         )
         self.tree.add_command(new_command)
 
+    async def save_command(self, name, script, replaces=None):
+        """
+        Register *script* as /name (renaming *replaces* if given), persist it
+        and queue a tree sync. Raises SyntaxError without changing anything.
+        """
+        self.create_dynamic_command(name, script)
+        if replaces and replaces != name:
+            self.tree.remove_command(replaces)
+            self.command_errors.pop(replaces, None)
+        # The command store can wait on another process's write lock: not on the bot loop
+        await asyncio.to_thread(config.set_command, name, script, replaces)
+        script_cache.retain(config.custom_commands.items())
+        self.sync_scheduler.request()
+
+    async def delete_custom_command(self, name) -> bool:
+        if not await asyncio.to_thread(config.delete_command, name):
+            return False
+        self.tree.remove_command(name)
+        self.command_errors.pop(name, None)
+        script_cache.retain(config.custom_commands.items())
+        self.sync_scheduler.request()
+        return True
+
 bot = DiscordBot()
 app = Flask(__name__, template_folder='.')
 app.secret_key = 'super_secret_dev_key_change_in_prod'
@@ -140,6 +361,112 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def cached_page(*sources):
+    """
+    Conditional GET and page cache for a read-only view. *sources* name the
+    stores the page shows ('logs', 'appeals'); their versions validate both.
+    A view that rendered something incomplete sets g.page_uncacheable.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.path, request.query_string.decode(), bool(session.get('logged_in')))
+            cond = page_check(sources, key, request.headers.get('If-None-Match'),
+                              request.headers.get('If-Modified-Since'))
+            if cond is None:
+                return view(*args, **kwargs)
+            if cond.not_modified:
+                return Response(status=304, headers=cond.headers)
+            page = page_cache.get(key, cond.version)
+            if page is not None:
+                return Response(page.body, content_type=page.content_type, headers=cond.headers)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or g.get('page_uncacheable'):
+                return response
+            response.headers.update(cond.headers)
+            if response.is_streamed:
+                response.response = page_cache.capture(response.response, key, cond.version,
+                                                       response.content_type)
+            else:
+                page_cache.put(key, cond.version, Page(response.get_data(), response.content_type))
+            return response
+        return wrapper
+    return decorator
+
+def _route_labels():
+    return {"route": request.url_rule.rule if request.url_rule else "unmatched", "method": request.method}
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    labels = _route_labels()
+    metrics.ROUTE_SECONDS.observe(time.perf_counter() - g.request_started, **labels)
+    if response.status_code >= 500:
+        metrics.ROUTE_ERRORS.inc(**labels)
+    g.request_recorded = True
+    return response
+
+@app.teardown_request
+def _record_failed_request(exc):
+    # after_request is skipped when a view raises
+    if exc is not None and 'request_started' in g and not g.get('request_recorded'):
+        labels = _route_labels()
+        metrics.ROUTE_SECONDS.observe(time.perf_counter() - g.request_started, **labels)
+        metrics.ROUTE_ERRORS.inc(**labels)
+
+def run_on_bot_loop(coro, timeout, call):
+    """
+    Run *coro* on the bot loop and block this (Flask) thread for the result.
+    Records how long the loop took to pick it up and how long we waited.
+    """
+    submitted = time.perf_counter()
+
+    async def _timed():
+        metrics.LOOP_SCHEDULE_SECONDS.observe(time.perf_counter() - submitted, call=call)
+        return await coro
+
+    future = asyncio.run_coroutine_threadsafe(_timed(), bot.loop)
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        metrics.LOOP_TIMEOUTS.inc(call=call)
+        raise
+    finally:
+        metrics.LOOP_WAIT_SECONDS.observe(time.perf_counter() - submitted, call=call)
+
+def call_bot(call, timeout, /, **args):
+    """
+    Run one of bot_ipc's calls: here (coroutines on the bot loop) in the bot
+    process, over the bot socket in a dashboard worker.
+    """
+    if bot_client is not None:
+        return bot_client.call(call, timeout, **args)
+    result = BOT_CALLS[call](bot, **args)
+    if asyncio.iscoroutine(result):
+        return run_on_bot_loop(result, timeout, call)
+    return result
+
+def wait_for_job(snapshot, timeout):
+    """Block up to *timeout* seconds for a job to finish; returns its latest snapshot either way."""
+    deadline = time.monotonic() + timeout
+    if bot_client is None:
+        job = bot.jobs.get(snapshot['id'])
+        while job and not job.done and time.monotonic() < deadline:
+            job.wait_for_change(job.version, deadline - time.monotonic())
+        return job.snapshot() if job else snapshot
+    while snapshot['status'] not in ('done', 'error') and time.monotonic() < deadline:
+        time.sleep(min(0.5, max(0, deadline - time.monotonic())))
+        snapshot = call_bot('job', 5, job_id=snapshot['id']) or snapshot
+    return snapshot
+
+@app.errorhandler(BotUnavailable)
+def bot_unavailable(e):
+    return jsonify({"status": "error", "message": str(e)}), 503
+
 # --- Flask Routes ---
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -160,49 +487,75 @@ def logout():
 @app.route('/')
 @login_required
 def index():
-    return render_template('dashboard.html', commands=config.get('custom_commands', {}))
+    return render_template('dashboard.html', commands=config.custom_commands, **call_bot('status', 5))
 
 @app.route('/logs')
+@cached_page('logs')
 def logs():
     # Logs are public so users can appeal
     search_query = request.args.get('search', '').strip()
-    all_logs = load_json_file(LOGS_FILE, [])
-    
-    # Filter logs
-    if search_query:
-        filtered_logs = [log for log in all_logs if search_query.lower() in str(log.get('user_id', '')).lower()]
-    else:
-        filtered_logs = all_logs
-
-    # Resolve Usernames
-    for log in filtered_logs:
-        if 'user_id' in log:
-            try:
-                future = asyncio.run_coroutine_threadsafe(bot.resolve_user(log['user_id']), bot.loop)
-                username = future.result(timeout=1) # 1 sec timeout
-                if username:
-                    log['username'] = username
-            except Exception:
-                pass 
-
-    filtered_logs.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-    return render_template('logs.html', logs=filtered_logs, search_query=search_query)
+    before = request.args.get('before') or None
+    offset = max(0, request.args.get('offset', 0, type=int))
+    # One page: browsing is keyed by log id (newest first), ranked search results by offset
+    filtered_logs, next_page = page_logs(search_query, before, offset, LOGS_PAGE_SIZE)
+
+    # Resolve Usernames (one hop to the bot loop for the whole page)
+    user_ids = {str(log['user_id']) for log in filtered_logs if 'user_id' in log}
+    usernames, pending = {}, False
+    if user_ids:
+        try:
+            resolved = call_bot('resolve_users', RESOLVE_DEADLINE + 1, user_ids=sorted(user_ids),
+                                deadline=RESOLVE_DEADLINE)
+            usernames, pending = resolved['names'], resolved['pending']
+        except Exception:
+            pending = True
+    if pending:
+        g.page_uncacheable = True      # don't freeze missing names into the cached page
+    if usernames and bot_client is not None:
+        index_usernames(usernames)     # the bot process indexed them; this one needs them too
+    if usernames:
+        # index entries are shared, so annotate copies
+        filtered_logs = [
+            dict(log, username=usernames[str(log['user_id'])]) if str(log.get('user_id')) in usernames else log
+            for log in filtered_logs
+        ]
+
+    next_url = url_for('logs', **next_page) if next_page else None
+    first_url = url_for('logs', search=search_query) if search_query else url_for('logs')
+    # Streamed, so the browser can start on the table before the last row is rendered
+    return Response(stream_template('logs.html', logs=filtered_logs, search_query=search_query,
+                                    next_url=next_url, first_url=first_url if (before or offset) else None))
+
+@app.route('/api/logs')
+@login_required
+def api_logs():
+    """
+    NDJSON export, newest first, archived months included. ?before=<id>
+    resumes after the last id received, ?limit= caps the count, ?search=
+    exports search results instead. Streamed, so memory stays flat.
+    """
+    search_query = request.args.get('search', '').strip()
+    limit = request.args.get('limit', type=int)
+    records = iter(search_logs(search_query)) if search_query else iter_logs(request.args.get('before') or None)
+    if limit:
+        records = itertools.islice(records, max(0, limit))
+    return Response(ndjson_chunks(records), mimetype='application/x-ndjson')
 
 @app.route('/appeals')
 @login_required
+@cached_page('appeals')
 def appeals():
-    all_appeals = load_json_file(APPEALS_FILE, [])
-    return render_template('appeals.html', appeals=all_appeals)
+    return render_template('appeals.html', appeals=appeal_store.all())
 
 @app.route('/appeal_case/<user_id>/<log_id>')
 @login_required
+@cached_page('logs', 'appeals')
 def appeal_case(user_id, log_id):
     log_entry = get_log(log_id)
     if not log_entry:
         return "Log not found", 404
 
-    all_appeals = load_json_file(APPEALS_FILE, [])
-    appeal = next((a for a in all_appeals if a.get('user_id') == user_id and a.get('log_id') == log_id), None)
+    appeal = appeal_store.get(user_id, log_id)
 
     return render_template('appeal_case.html', user_id=user_id, log_id=log_id, log_entry=log_entry, appeal=appeal)
 
@@ -217,27 +570,7 @@ def api_accept_appeal():
     if not user_id or not log_id or not action:
         return jsonify({"status": "error", "message": "Missing fields"}), 400
 
-    async def _task():
-        try:
-            main_server_id = config.get('main_server')
-            if not main_server_id:
-                return False, "Main server ID not configured."
-            guild = bot.get_guild(int(main_server_id))
-            if not guild:
-                return False, "Bot not in main server."
-            await perform_accept_action(bot, guild, user_id, action, reason)
-
-            # Dismiss appeal
-            all_appeals = load_json_file(APPEALS_FILE, [])
-            new_appeals = [a for a in all_appeals if not (a.get('user_id') == user_id and a.get('log_id') == log_id)]
-            save_json_file(APPEALS_FILE, new_appeals)
-
-            return True, "Appeal accepted and action performed."
-        except Exception as e:
-            return False, f"Error: {e}"
-
-    future = asyncio.run_coroutine_threadsafe(_task(), bot.loop)
-    success, result = future.result(timeout=10)
+    success, result = call_bot('accept', 10, user_id=user_id, log_id=log_id, action=action, reason=reason)
     if success:
         return jsonify({"status": "success", "message": result})
     else:
@@ -253,33 +586,34 @@ def api_deny_appeal():
     if not user_id or not log_id:
         return jsonify({"status": "error", "message": "Missing fields"}), 400
 
-    async def _task():
-        try:
-            all_appeals = load_json_file(APPEALS_FILE, [])
-            appeal = next((a for a in all_appeals if a.get('user_id') == user_id and a.get('log_id') == log_id), None)
-
-            if appeal and appeal.get('thread_id'):
-                try:
-                    thread = await bot.fetch_channel(int(appeal.get('thread_id')))
-                    await thread.send(f"This appeal has been denied. Reason: {reason}")
-                except Exception as e:
-                    logging.error(f"Failed to send denial to thread: {e}")
-
-            # Dismiss appeal
-            new_appeals = [a for a in all_appeals if not (a.get('user_id') == user_id and a.get('log_id') == log_id)]
-            save_json_file(APPEALS_FILE, new_appeals)
-
-            return True, "Appeal denied and thread notified."
-        except Exception as e:
-            return False, f"Error: {e}"
-
-    future = asyncio.run_coroutine_threadsafe(_task(), bot.loop)
-    success, result = future.result(timeout=10)
+    success, result = call_bot('deny', 10, user_id=user_id, log_id=log_id, reason=reason)
     if success:
         return jsonify({"status": "success", "message": result})
     else:
         return jsonify({"status": "error", "message": result}), 500
 
+@app.route('/api/bulk_appeals', methods=['POST'])
+@login_required
+def api_bulk_appeals():
+    payload = request.get_json(silent=True)
+    error = bulk_request_error(payload)
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+
+    appeals = payload['appeals']
+    # A job, so a slow batch keeps running (and keeps its report) past this request
+    job = call_bot('bulk', 10, appeals=appeals, decision=payload['decision'],
+                   action=payload.get('action', 'unban'), reason=payload.get('reason'))
+    job = wait_for_job(job, 10 + len(appeals))
+    if job['status'] == 'error':
+        return jsonify({"status": "error", "message": job['error'], "job_id": job['id']}), 500
+    if job['status'] != 'done':
+        return jsonify({"status": "accepted", "job_id": job['id'],
+                        "message": "Still running; follow /api/jobs/<job_id> for the results"}), 202
+    report = job['result']
+    succeeded = sum(1 for r in report if r['status'] == 'success')
+    return jsonify({"status": "success", "succeeded": succeeded, "failed": len(report) - succeeded, "results": report})
+
 @app.route('/api/invite_user', methods=['POST'])
 @login_required
 def api_invite_user():
@@ -287,13 +621,7 @@ def api_invite_user():
     if not user_id:
         return jsonify({"status": "error", "message": "Missing user_id"}), 400
 
-    async def _task():
-        invite_link = config.get('application_invite_link', 'https://discord.gg/invalid')
-        await notify_user_of_appeal(bot, user_id, invite_link)
-        return "Invite sent."
-
-    future = asyncio.run_coroutine_threadsafe(_task(), bot.loop)
-    result = future.result(timeout=10)
+    result = call_bot('invite_user', 10, user_id=user_id)
     return jsonify({"status": "success", "message": result})
 
 @app.route('/add_cmd', methods=['POST'])
@@ -302,10 +630,10 @@ def add_cmd():
     name = request.form.get('name', '').strip().lower()
     script = request.form.get('script', '').strip()
     if name and script:
-        config['custom_commands'][name] = script
-        save_json_file(CONFIG_FILE, config)
-        bot.create_dynamic_command(name, script)
-        asyncio.run_coroutine_threadsafe(bot.tree.sync(), bot.loop)
+        try:
+            call_bot('save_command', 10, name=name, script=script)
+        except SyntaxError as e:
+            return jsonify({"status": "error", "message": f"Compile error: {e}"}), 400
         return jsonify({"status": "success"})
     return jsonify({"status": "error", "message": "Invalid name or script"}), 400
 
@@ -313,14 +641,25 @@ def add_cmd():
 @login_required
 def delete_cmd():
     name = request.form.get('name', '').strip().lower()
-    if name in config['custom_commands']:
-        del config['custom_commands'][name]
-        save_json_file(CONFIG_FILE, config)
-        bot.tree.remove_command(name)
-        asyncio.run_coroutine_threadsafe(bot.tree.sync(), bot.loop)
+    if call_bot('delete_command', 10, name=name):
         return jsonify({"status": "success"})
     return jsonify({"status": "error", "message": "Command not found"}), 404
 
+@app.route('/metrics')
+@login_required
+def metrics_route():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/compact_logs', methods=['POST'])
+@login_required
+def compact_logs_route():
+    try:
+        summary = compact_logs(config.get('log_retention_months', 0))
+    except Exception as e:
+        logging.error(f"Log compaction failed: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+    return jsonify({"status": "success", "summary": summary})
+
 @app.route('/edit_cmd', methods=['POST'])
 @login_required
 def edit_cmd():
@@ -329,19 +668,14 @@ def edit_cmd():
     new_script = request.form.get('script', '').strip()
     if not old_name or not new_name or not new_script:
         return jsonify({"status": "error", "message": "All fields required"}), 400
-    if old_name not in config['custom_commands']:
+    if old_name not in config.custom_commands:
         return jsonify({"status": "error", "message": "Command not found"}), 404
-    # Remove old
-    del config['custom_commands'][old_name]
-    # Add new
-    config['custom_commands'][new_name] = new_script
+    # Replace old with new (compiles first, so a broken script changes nothing)
+    try:
+        call_bot('save_command', 10, name=new_name, script=new_script, replaces=old_name)
+    except SyntaxError as e:
+        return jsonify({"status": "error", "message": f"Compile error: {e}"}), 400
     logging.info(f"Updated command {old_name} to {new_name}")
-    save_json_file(CONFIG_FILE, config)
-    logging.info("Config saved")
-    # Update bot
-    bot.tree.remove_command(old_name)
-    bot.create_dynamic_command(new_name, new_script)
-    asyncio.run_coroutine_threadsafe(bot.tree.sync(), bot.loop)
     return jsonify({"status": "success"})
 
 @app.route('/generate_cmd', methods=['POST'])
@@ -351,26 +685,9 @@ def generate_cmd():
     description = request.form.get('description', '').strip()
     if not name or not description:
         return jsonify({"status": "error", "message": "Name and description required"}), 400
-    try:
-        prompt = f"Generate Python code for a Discord slash command that {description}. Output only the executable Python statements for the command handler, no function definitions, explanations, or markdown. The code should use 'interaction' to respond."
-        logging.info(f"Running qwen.cmd with prompt: {prompt}")
-        result = subprocess.run(['qwen.cmd', prompt], capture_output=True, text=True, timeout=30)
-        logging.info(f"Qwen result: returncode={result.returncode}, stdout='{result.stdout}', stderr='{result.stderr}'")
-        if result.returncode == 0:
-            script = result.stdout.strip()
-            if script:
-                config['custom_commands'][name] = script
-                save_json_file(CONFIG_FILE, config)
-                bot.create_dynamic_command(name, script)
-                asyncio.run_coroutine_threadsafe(bot.tree.sync(), bot.loop)
-                return jsonify({"status": "success"})
-            else:
-                return jsonify({"status": "error", "message": "No code generated"}), 400
-        else:
-            return jsonify({"status": "error", "message": f"Qwen failed: {result.stderr}"}), 500
-    except Exception as e:
-        logging.error(f"Exception in generate_cmd: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+    # The model can take a while; the page follows the job instead of holding this thread
+    job = call_bot('generate', 10, name=name, description=description)
+    return jsonify({"status": "accepted", "job_id": job['id'], "message": "Generating..."}), 202
 
 @app.route('/submit_appeal', methods=['POST'])
 def submit_appeal():
@@ -381,23 +698,9 @@ def submit_appeal():
     if not log_id or not appeal_text:
         return jsonify({"status": "error", "message": "Missing fields"}), 400
     
-    # Verify log exists
-    all_logs = load_json_file(LOGS_FILE, [])
-    log_entry = next((item for item in all_logs if item["id"] == log_id), None)
-    
-    if not log_entry:
+    # Verify log exists and file the appeal (newest first)
+    if not file_appeal(log_id, appeal_text):
         return jsonify({"status": "error", "message": "Invalid Log ID"}), 400
-
-    new_appeal = {
-        "log_id": log_id,
-        "user_id": log_entry.get('user_id'),
-        "text": appeal_text,
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-
-    all_appeals = load_json_file(APPEALS_FILE, [])
-    all_appeals.insert(0, new_appeal) # Newest first
-    save_json_file(APPEALS_FILE, all_appeals)
     
     return jsonify({"status": "success", "message": "Appeal submitted"})
 
@@ -410,14 +713,10 @@ def dismiss_appeal():
     if not user_id or not log_id:
         return jsonify({"status": "error", "message": "Missing IDs"}), 400
         
-    all_appeals = load_json_file(APPEALS_FILE, [])
-    # Filter out the appeal that matches both user_id and log_id
-    new_appeals = [a for a in all_appeals if not (a.get('user_id') == user_id and a.get('log_id') == log_id)]
-    
-    if len(new_appeals) == len(all_appeals):
-         return jsonify({"status": "error", "message": "Appeal not found"}), 404
-         
-    save_json_file(APPEALS_FILE, new_appeals)
+    # Remove the appeal that matches both user_id and log_id
+    if appeal_store.delete(user_id, log_id) is None:
+        return jsonify({"status": "error", "message": "Appeal not found"}), 404
+
     return jsonify({"status": "success", "message": "Appeal dismissed"})
 
 @app.route('/open_case', methods=['POST'])
@@ -429,81 +728,68 @@ def open_case():
     if not user_id or not log_id:
         return jsonify({"status": "error", "message": "Missing IDs"}), 400
 
-    async def _create_thread_task():
-        channel_id = config.get('app_channel_id')
-        if not channel_id:
-            return "App channel ID not configured in config.json."
-        
-        try:
-            channel = bot.get_channel(int(channel_id))
-            if not channel:
-                # Try fetching if not in cache
-                channel = await bot.fetch_channel(int(channel_id))
-        except Exception:
-            return "Could not find configured log channel."
+    # Runs in the background; the page follows /api/jobs/<id>/events for progress
+    job = call_bot('open_case', 10, user_id=user_id, log_id=log_id)
+    return jsonify({"status": "accepted", "job_id": job['id'], "message": "Opening case..."}), 202
 
-        try:
-            # Send initial message
-            msg_content = f"Appeal Case - <@{user_id}> [Log ID: {log_id}]"
-            message = await channel.send(msg_content)
-            
-            # Create thread
-            thread = await message.create_thread(name=f"appeal-{user_id}", auto_archive_duration=1440)
-            
-            # Store thread_id in appeal entry
-            all_appeals = load_json_file(APPEALS_FILE, [])
-            for a in all_appeals:
-                if a.get('user_id') == user_id and a.get('log_id') == log_id:
-                    a['thread_id'] = str(thread.id)
-                    break
-            save_json_file(APPEALS_FILE, all_appeals)
-
-            # Attempt to add user (Note: May fail if user is banned and not in the server)
-            try:
-                user = await bot.fetch_user(int(user_id))
-                await thread.add_user(user)
-                thread_result = "Thread created and user added."
-            except discord.Forbidden:
-                await thread.send("Created thread, but could not add user (Permissions error or user banned).")
-                thread_result = "Thread created (User add failed: Forbidden)."
-            except Exception as e:
-                await thread.send(f"Created thread, but error adding user: {e}")
-                thread_result = f"Thread created (User add failed: {e})."
-            
-            # Send invite link DM to user
-            invite_link = config.get('application_invite_link', 'https://discord.gg/invalid')
-            try:
-                await notify_user_of_appeal(bot, user_id, invite_link)
-                thread_result += " User notified via DM."
-            except Exception as e:
-                logging.error(f"Failed to notify user {user_id}: {e}")
-                
-            return thread_result
-                
-        except Exception as e:
-            return f"Bot Error: {e}"
-
-    # Execute async task from Flask
-    future = asyncio.run_coroutine_threadsafe(_create_thread_task(), bot.loop)
-    try:
-        result = future.result(timeout=10)
-        return jsonify({"status": "success", "message": result})
-    except Exception as e:
-        return jsonify({"status": "error", "message": f"Timeout or Error: {str(e)}"}), 500
+@app.route('/api/jobs/<job_id>')
+@login_required
+def api_job(job_id):
+    job = call_bot('job', 5, job_id=job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>/events')
+@login_required
+def api_job_events(job_id):
+    if bot_client is not None:
+        # The job runs in the bot process: follow it by polling over the socket
+        if not call_bot('job', 5, job_id=job_id):
+            return jsonify({"status": "error", "message": "Job not found"}), 404
+        events = sse_poll_stream(lambda: call_bot('job', 5, job_id=job_id))
+    else:
+        job = bot.jobs.get(job_id)
+        if not job:
+            return jsonify({"status": "error", "message": "Job not found"}), 404
+        events = sse_stream(job)
+    return Response(events, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 def run_flask():
     app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
 
 async def main():
-    flask_thread = threading.Thread(target=run_flask, daemon=True)
-    flask_thread.start()
-    
-    token = config.get('token')
-    if token:
-        async with bot:
-            await bot.start(token)
-    else:
-        logging.error("No Discord token provided in config.json")
+    # "thread" (default): Flask dev server in a daemon thread
+    # "async": aiohttp app on the bot's event loop (see dashboard_async.py)
+    # "none": dashboard workers run separately (MODBOT_ROLE=dashboard) and talk to bot_socket
+    dashboard_runner = None
+    dashboard_mode = config.get('dashboard_mode', 'thread')
+    if dashboard_mode == 'async':
+        from dashboard_async import start_dashboard
+        dashboard_runner = await start_dashboard(bot, app, pass_config.get('password'))
+    elif dashboard_mode != 'none':
+        flask_thread = threading.Thread(target=run_flask, daemon=True)
+        flask_thread.start()
+
+    ipc_server = None
+    if config.get('bot_socket'):
+        ipc_server = IPCServer(bot, config.get('bot_socket'))
+        await ipc_server.start()
+
+    token = config.token
+    try:
+        if token:
+            async with bot:
+                await bot.start(token)
+        else:
+            logging.error("No Discord token provided in config.json")
+    finally:
+        if ipc_server:
+            await ipc_server.close()
+        if dashboard_runner:
+            await dashboard_runner.cleanup()
+        await asyncio.to_thread(persistence.flush)
 
 if __name__ == "__main__":
     try:
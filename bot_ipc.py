@@ -0,0 +1,244 @@
+# bot_ipc.py
+"""
+Local bridge between dashboard worker processes and the bot (gateway) process.
+
+Discord actions need the bot's event loop, which only exists in the process
+connected to the gateway. With ``bot_socket`` set in config.json, that process
+listens on a Unix socket; a dashboard started with ``MODBOT_ROLE=dashboard``
+(e.g. several gunicorn workers) sends the actions there instead of running
+them itself. Storage is shared through sqlite_store, so only the calls below
+cross the socket.
+
+Protocol: one JSON object per line. Request {"call": name, "args": {...}},
+reply {"ok": true, "result": ...} or {"ok": false, "error": type, "message": ...}.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from typing import Callable, Dict, Optional
+
+import metrics
+import persistence
+from command_generator import generate_command
+from config_service import get_config
+from gateway_cache import memory_report
+from log_helper import log_storage_stats
+from moderation import accept_appeal, deny_appeal, notify_user_of_appeal, open_appeal_case, process_appeals
+
+BOT_SOCKET = "modbot.sock"
+MAX_MESSAGE = 4 * 1024 * 1024
+
+# name -> handler(bot, **args); coroutine handlers are awaited on the bot loop
+CALLS: Dict[str, Callable] = {}
+
+
+def register(name: str):
+    def add(handler):
+        CALLS[name] = handler
+        return handler
+    return add
+
+
+class BotUnavailable(RuntimeError):
+    """The bot process isn't listening (not started, or restarting)."""
+
+
+class RemoteError(RuntimeError):
+    """A call failed inside the bot process with an exception we don't re-raise as-is."""
+
+
+# Exceptions the dashboard routes handle themselves, re-raised with their own type
+_REMOTE_TYPES = {"SyntaxError": SyntaxError, "ValueError": ValueError, "TimeoutError": TimeoutError}
+
+
+# -- calls --------------------------------------------------------------------
+
+@register("status")
+def dashboard_status(bot) -> Dict:
+    """What the dashboard index shows about the bot process."""
+    return {
+        "command_errors": bot.command_errors,
+        "user_cache_stats": bot.user_cache.stats(),
+        "fetch_stats": bot.fetch_stats(),
+        "request_queues": bot.request_scheduler.stats(),
+        "moderation_events": bot.moderation_events.stats(),
+        "loop_health": bot.watchdog.stats(),
+        "memory": memory_report(bot),
+        "sync_status": bot.sync_scheduler.status(),
+        "persistence_stats": persistence.get_worker().stats(),
+        "log_storage": log_storage_stats(),
+    }
+
+
+@register("resolve_users")
+async def _resolve_users(bot, user_ids, deadline: float) -> Dict:
+    names = await bot.resolve_users(user_ids, timeout=deadline)
+    return {"names": names, "pending": bot.names_pending(user_ids, names)}
+
+
+@register("accept")
+async def _accept(bot, user_id, log_id, action, reason):
+    return await accept_appeal(bot, user_id, log_id, action, reason)
+
+
+@register("deny")
+async def _deny(bot, user_id, log_id, reason):
+    return await deny_appeal(bot, user_id, log_id, reason)
+
+
+@register("bulk")
+def _bulk(bot, appeals, decision, action, reason) -> Dict:
+    job = bot.jobs.submit('bulk', lambda job: process_appeals(bot, appeals, decision, action, reason),
+                          label=f"{decision} {len(appeals)}")
+    return job.snapshot()
+
+
+@register("invite_user")
+async def _invite_user(bot, user_id):
+    await notify_user_of_appeal(bot, user_id, get_config().application_invite_link)
+    return "Invite sent."
+
+
+@register("open_case")
+def _open_case(bot, user_id, log_id) -> Dict:
+    job = bot.jobs.submit('open_case', lambda job: open_appeal_case(bot, user_id, log_id, progress=job.step),
+                          label=f"{user_id}/{log_id}")
+    return job.snapshot()
+
+
+@register("generate")
+def _generate(bot, name, description) -> Dict:
+    job = bot.jobs.submit('generate', lambda job: generate_command(bot, name, description, progress=job.step),
+                          label=name)
+    return job.snapshot()
+
+
+@register("job")
+def _job(bot, job_id) -> Optional[Dict]:
+    job = bot.jobs.get(job_id)
+    return job.snapshot() if job else None
+
+
+@register("save_command")
+async def _save_command(bot, name, script, replaces=None) -> None:
+    await bot.save_command(name, script, replaces=replaces)
+
+
+@register("delete_command")
+async def _delete_command(bot, name) -> bool:
+    return await bot.delete_custom_command(name)
+
+
+# -- server (bot process) -----------------------------------------------------
+
+class IPCServer:
+    """Serves CALLS on a Unix socket, on the bot loop. One request per line, answered in order."""
+
+    def __init__(self, bot, path: str = BOT_SOCKET):
+        self.bot = bot
+        self.path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.calls = 0
+        self.errors = 0
+
+    async def start(self) -> None:
+        if not hasattr(socket, "AF_UNIX"):
+            logging.error("bot_socket needs Unix domain sockets, which this platform doesn't have")
+            return
+        if os.path.exists(self.path):
+            os.remove(self.path)                  # left over from a previous run
+        self._server = await asyncio.start_unix_server(self._serve, path=self.path, limit=MAX_MESSAGE)
+        os.chmod(self.path, 0o600)                # only processes of this user may drive the bot
+        logging.info(f"Bot IPC listening on {self.path}")
+
+    async def close(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    break                             # oversized request
+                if not line:
+                    break
+                writer.write(json.dumps(await self._dispatch(line), default=str).encode("utf-8") + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass                                      # client gone, or the bot is shutting down
+        finally:
+            writer.close()
+
+    async def _dispatch(self, line: bytes) -> Dict:
+        self.calls += 1
+        try:
+            request = json.loads(line)
+            handler = CALLS.get(request.get("call"))
+            if handler is None:
+                raise ValueError(f"Unknown bot call {request.get('call')!r}")
+            result = handler(self.bot, **request.get("args", {}))
+            if asyncio.iscoroutine(result):
+                result = await result
+            return {"ok": True, "result": result}
+        except Exception as e:
+            self.errors += 1
+            if not isinstance(e, (SyntaxError, ValueError)):
+                logging.error(f"Bot IPC call failed: {e!r}")
+            return {"ok": False, "error": type(e).__name__, "message": str(e)}
+
+
+# -- client (dashboard workers) -----------------------------------------------
+
+class BotClient:
+    """
+    Blocking client for the Flask routes. One short connection per call, so
+    it is safe to share between threads and survives bot restarts.
+    """
+
+    def __init__(self, path: str = BOT_SOCKET):
+        self.path = path
+
+    def call(self, name: str, timeout: float, /, **args):
+        started = time.perf_counter()
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(timeout)
+                try:
+                    sock.connect(self.path)
+                except (FileNotFoundError, ConnectionRefusedError) as e:
+                    raise BotUnavailable(f"Bot is not running ({e.strerror})")
+                sock.sendall(json.dumps({"call": name, "args": args}).encode("utf-8") + b"\n")
+                reply = self._read_line(sock)
+        except socket.timeout:
+            metrics.LOOP_TIMEOUTS.inc(call=name)
+            raise TimeoutError(f"Bot did not answer {name} within {timeout}s")
+        finally:
+            metrics.LOOP_WAIT_SECONDS.observe(time.perf_counter() - started, call=name)
+
+        if reply.get("ok"):
+            return reply.get("result")
+        error = _REMOTE_TYPES.get(reply.get("error"), RemoteError)
+        raise error(reply.get("message", "Bot IPC call failed"))
+
+    @staticmethod
+    def _read_line(sock: socket.socket) -> Dict:
+        parts = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                raise BotUnavailable("Bot closed the connection")
+            parts.append(chunk)
+            if chunk.endswith(b"\n"):
+                return json.loads(b"".join(parts))
@@ -0,0 +1,165 @@
+# command_generator.py
+"""
+Command script generation for the dashboard's "Generate" form.
+
+The model runs behind a backend: any object with ``async generate(prompt) -> str``.
+The default, CliBackend, runs the configured command (``qwen.cmd`` unless
+``generator_command`` says otherwise) as an async subprocess with the prompt as
+its last argument, so a local stand-in script works for testing. At most
+``generator_concurrency`` generations run at once, and scripts that compile
+are cached by (description, prompt template) so asking again is instant.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import script_cache
+from config_service import get_config
+from persistence import get_worker
+from single_flight import SingleFlight
+
+PROMPT_TEMPLATE = (
+    "Generate Python code for a Discord slash command that {description}. "
+    "Output only the executable Python statements for the command handler, no function definitions, "
+    "explanations, or markdown. The code should use 'interaction' to respond."
+)
+GENERATOR_CACHE_FILE = "generator_cache.json"
+CACHE_SIZE = 200
+
+
+class CliBackend:
+    """Runs `command... <prompt>` and returns its stdout; a non-zero exit raises RuntimeError."""
+
+    def __init__(self, command: List[str], timeout: float = 30):
+        self.command = list(command)
+        self.timeout = timeout
+
+    async def generate(self, prompt: str) -> str:
+        logging.info(f"Running {self.command[0]} with prompt: {prompt}")
+        proc = await asyncio.create_subprocess_exec(*self.command, prompt,
+                                                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), self.timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise RuntimeError(f"{self.command[0]} timed out after {self.timeout}s")
+        stdout, stderr = stdout.decode(errors="replace"), stderr.decode(errors="replace")
+        logging.info(f"Generator result: returncode={proc.returncode}, stdout='{stdout}', stderr='{stderr}'")
+        if proc.returncode != 0:
+            raise RuntimeError(f"{self.command[0]} failed: {stderr}")
+        return stdout
+
+
+class ScriptGenerator:
+    def __init__(self, backend, concurrency: int = 2, cache_path: Optional[str] = GENERATOR_CACHE_FILE):
+        self.backend = backend
+        self.concurrency = max(1, int(concurrency))
+        self.cache_path = cache_path
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Identical requests that arrive together share one backend run
+        self._flights = SingleFlight("generate", self._run, ttl=0)
+        self._load()
+
+    @staticmethod
+    def cache_key(description: str, template: str = PROMPT_TEMPLATE) -> str:
+        return hashlib.sha256(f"{template}\0{description}".encode("utf-8")).hexdigest()
+
+    def _load(self) -> None:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                self._cache.update(json.load(f))
+        except Exception as e:
+            logging.error(f"Error loading {self.cache_path}: {e}")
+
+    def _store(self, key: str, script: str) -> None:
+        self._cache[key] = script
+        self._cache.move_to_end(key)
+        while len(self._cache) > CACHE_SIZE:
+            self._cache.popitem(last=False)
+        if self.cache_path:
+            snapshot = dict(self._cache)
+            get_worker().write_json(self.cache_path, lambda: snapshot)
+
+    async def generate(self, description: str, name: str = "generated") -> Tuple[str, bool]:
+        """
+        Return (script, cached). The script is already compiled (and in
+        script_cache), so registering it doesn't compile again. Raises
+        RuntimeError if the backend fails and SyntaxError if its output
+        doesn't compile; neither is cached.
+        """
+        key = self.cache_key(description)
+        script = self._cache.get(key)
+        if script is not None:
+            self._cache.move_to_end(key)
+            return script, True
+        script = await self._flights.get((key, description, name))
+        return script, False
+
+    async def _run(self, flight) -> str:
+        key, description, name = flight
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            script = (await self.backend.generate(PROMPT_TEMPLATE.format(description=description))).strip()
+        if script:
+            script_cache.compile_script(script, name)
+            self._store(key, script)
+        return script
+
+    def stats(self) -> dict:
+        return dict(self._flights.stats(), cached=len(self._cache), concurrency=self.concurrency)
+
+
+_generator: Optional[ScriptGenerator] = None
+
+
+def get_generator() -> ScriptGenerator:
+    global _generator
+    if _generator is None:
+        config = get_config()
+        command = config.get('generator_command', ['qwen.cmd'])
+        if isinstance(command, str):
+            command = command.split()
+        backend = CliBackend(command, timeout=config.get('generator_timeout', 30))
+        _generator = ScriptGenerator(backend, concurrency=config.get('generator_concurrency', 2))
+    return _generator
+
+
+def set_backend(backend) -> None:
+    """Swap the model backend (e.g. a stub in tests); the script cache is kept."""
+    get_generator().backend = backend
+
+
+async def generate_script(description: str, name: str = "generated") -> Tuple[str, bool]:
+    return await get_generator().generate(description, name)
+
+
+async def generate_command(bot, name: str, description: str, progress=None) -> str:
+    """Generate, compile and register /name. Runs as a dashboard job; *progress* is job.step."""
+    report = progress or (lambda *args: None)
+    report("generate")
+    try:
+        script, cached = await generate_script(description, name)
+    except SyntaxError as e:
+        report("generate", "error", "does not compile")
+        raise RuntimeError(f"Generated code does not compile: {e}")
+    except Exception as e:
+        report("generate", "error", str(e))
+        raise
+    if not script:
+        report("generate", "error", "empty output")
+        raise RuntimeError("No code generated")
+    report("generate", "done", "from cache" if cached else "")
+
+    report("register")
+    await bot.save_command(name, script)    # compiled above, so this is a cache hit
+    report("register", "done")
+    return f"Registered /{name}"
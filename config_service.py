@@ -0,0 +1,176 @@
+# config_service.py
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+CONFIG_FILE = "config.json"
+DEFAULT_CONFIG = {"token": "", "log_channel_id": "", "custom_commands": {}}
+DEFAULT_INVITE_LINK = "https://discord.gg/invalid"
+
+
+def _snowflake(value) -> Optional[int]:
+    """Discord ids are stored as strings; placeholders like 'MAIN_SERVER_ID' count as unset."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ConfigService:
+    """
+    Parsed config.json shared by the bot, the dashboard and command scripts.
+    The file is re-read only when its mtime/size changes, and that is checked
+    at most once per *check_interval* seconds.
+    """
+
+    def __init__(self, path: str = CONFIG_FILE, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._data: Dict[str, Any] = {}
+        self._signature = None
+        self._checked_at = 0.0
+        self._commands = None      # see use_command_store()
+        self._load()
+
+    # -- disk -------------------------------------------------------------
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            self._data = json.loads(json.dumps(DEFAULT_CONFIG))
+            self._write()
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            # Keep serving the last good config rather than an empty one
+            logging.error(f"Error loading {self.path}: {e}")
+            data = self._data or json.loads(json.dumps(DEFAULT_CONFIG))
+        data.setdefault("custom_commands", {})
+        self._data = data
+        self._signature = self._stat()
+
+    def _write(self) -> None:
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, indent=4)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.error(f"Error saving {self.path}: {e}")
+        self._signature = self._stat()
+
+    def _current(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                self._checked_at = now
+                self._load_if_changed()
+        return self._data
+
+    def reload(self) -> None:
+        with self._lock:
+            self._load()
+
+    # -- generic access ---------------------------------------------------
+
+    def get(self, key: str, default=None):
+        return self._current().get(key, default)
+
+    def __getitem__(self, key: str):
+        return self._current()[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._current()
+
+    # -- typed accessors --------------------------------------------------
+
+    @property
+    def token(self) -> str:
+        return self.get("token") or ""
+
+    @property
+    def main_server(self) -> Optional[int]:
+        return _snowflake(self.get("main_server"))
+
+    @property
+    def app_server(self) -> Optional[int]:
+        return _snowflake(self.get("app_server"))
+
+    @property
+    def app_channel_id(self) -> Optional[int]:
+        return _snowflake(self.get("app_channel_id"))
+
+    @property
+    def log_channel_id(self) -> Optional[int]:
+        return _snowflake(self.get("log_channel_id"))
+
+    @property
+    def application_invite_link(self) -> str:
+        return self.get("application_invite_link") or DEFAULT_INVITE_LINK
+
+    @property
+    def custom_commands(self) -> Dict[str, str]:
+        if self._commands is not None:
+            return self._commands.all()
+        return self._current()["custom_commands"]
+
+    # -- custom command edits ---------------------------------------------
+
+    def use_command_store(self, store) -> None:
+        """
+        Keep custom commands in *store* (all / set / delete, e.g.
+        sqlite_store.SqliteCommandStore) instead of config.json, so several
+        processes can edit them safely.
+        """
+        self._commands = store
+
+    def set_command(self, name: str, script: str, replaces: Optional[str] = None) -> None:
+        """Add or replace a custom command (renaming *replaces* if given) and save."""
+        if self._commands is not None:
+            self._commands.set(name, script, replaces=replaces)
+            return
+        with self._lock:
+            self._load_if_changed()
+            commands = self._data["custom_commands"]
+            if replaces is not None:
+                commands.pop(replaces, None)
+            commands[name] = script
+            self._write()
+
+    def delete_command(self, name: str) -> bool:
+        if self._commands is not None:
+            return self._commands.delete(name)
+        with self._lock:
+            self._load_if_changed()
+            if name not in self._data["custom_commands"]:
+                return False
+            del self._data["custom_commands"][name]
+            self._write()
+            return True
+
+    def _load_if_changed(self) -> None:
+        if self._stat() != self._signature:
+            self._load()
+
+
+_service: Optional[ConfigService] = None
+
+
+def get_config() -> ConfigService:
+    """The process-wide config service."""
+    global _service
+    if _service is None:
+        _service = ConfigService()
+    return _service
@@ -0,0 +1,487 @@
+# dashboard_async.py
+"""
+The web dashboard as an aiohttp app served from the bot's own event loop.
+
+Same templates, URLs and login cookie as the Flask app in bot.py, but every
+route is a coroutine, so Discord calls are awaited directly instead of
+parking a Werkzeug thread on run_coroutine_threadsafe(...).result().
+Enabled with "dashboard_mode": "async" in config.json.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from aiohttp import web
+from flask import render_template, stream_template
+
+from appeal_store import get_store as get_appeal_store
+from bot_ipc import dashboard_status
+from command_generator import generate_command
+from config_service import get_config
+from log_helper import (get_log, search_logs, compact_logs,
+                        iter_logs, page_logs, ndjson_chunks, PAGE_SIZE as LOGS_PAGE_SIZE)
+import metrics
+from jobs import sse_event
+from page_cache import Page, page_cache, check as page_check
+from moderation import (notify_user_of_appeal, submit_appeal as file_appeal,
+                        accept_appeal, deny_appeal, open_appeal_case, process_appeals, bulk_request_error)
+
+
+def _json(payload, status=200):
+    return web.json_response(payload, status=status)
+
+
+def _redirect(location):
+    return web.Response(status=302, headers={"Location": location})
+
+
+def login_required(handler):
+    @wraps(handler)
+    async def wrapper(self, request):
+        if not request["session"].get("logged_in"):
+            return _redirect("/login")
+        return await handler(self, request)
+    return wrapper
+
+
+def cached_page(*sources):
+    """
+    Conditional GET and page cache, like bot.cached_page: answers 304 or a
+    cached copy up front; otherwise render()/stream() attach the validators
+    and store the page unless the handler set request["page_uncacheable"].
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(self, request):
+            key = (request.path, request.query_string, bool(request["session"].get("logged_in")))
+            cond = page_check(sources, key, request.headers.get("If-None-Match"),
+                              request.headers.get("If-Modified-Since"))
+            if cond is not None:
+                if cond.not_modified:
+                    return web.Response(status=304, headers=cond.headers)
+                page = page_cache.get(key, cond.version)
+                if page is not None:
+                    return web.Response(body=page.body, headers=dict(cond.headers, **{"Content-Type": page.content_type}))
+                request["page_cache"] = cond
+            return await handler(self, request)
+        return wrapper
+    return decorator
+
+
+def _cacheable(request):
+    cond = request.get("page_cache") if request is not None else None
+    return None if cond is None or request.get("page_uncacheable") else cond
+
+
+class AsyncDashboard:
+    def __init__(self, bot, flask_app, password):
+        self.bot = bot
+        self.flask_app = flask_app      # templates + session signing are shared with the Flask app
+        self.password = password
+        self.config = get_config()
+        self.appeals = get_appeal_store()
+        self._serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        self._cookie_name = flask_app.config["SESSION_COOKIE_NAME"]
+        self._max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+
+    # -- plumbing ---------------------------------------------------------
+
+    @web.middleware
+    async def session_middleware(self, request, handler):
+        session = {}
+        cookie = request.cookies.get(self._cookie_name)
+        if cookie:
+            try:
+                session = self._serializer.loads(cookie, max_age=self._max_age)
+            except Exception:
+                session = {}
+        request["session"] = session
+        request["session_modified"] = False
+        response = await handler(request)
+        if request["session_modified"]:
+            if session:
+                response.set_cookie(self._cookie_name, self._serializer.dumps(session), httponly=True, path="/")
+            else:
+                response.del_cookie(self._cookie_name, path="/")
+        return response
+
+    @web.middleware
+    async def metrics_middleware(self, request, handler):
+        route = request.match_info.route.resource
+        labels = {"route": route.canonical if route else "unmatched", "method": request.method}
+        started = time.perf_counter()
+        try:
+            response = await handler(request)
+        except web.HTTPException as e:
+            if e.status >= 500:
+                metrics.ROUTE_ERRORS.inc(**labels)
+            raise
+        except Exception:
+            metrics.ROUTE_ERRORS.inc(**labels)
+            raise
+        finally:
+            metrics.ROUTE_SECONDS.observe(time.perf_counter() - started, **labels)
+        if response.status >= 500:
+            metrics.ROUTE_ERRORS.inc(**labels)
+        return response
+
+    def _render_sync(self, template, context):
+        with self.flask_app.app_context():
+            return render_template(template, **context)
+
+    async def render(self, template, status=200, request=None, **context):
+        # Jinja rendering of a big page is CPU work – keep it off the gateway loop
+        html = await asyncio.to_thread(self._render_sync, template, context)
+        response = web.Response(text=html, status=status, content_type="text/html")
+        cond = _cacheable(request)
+        if cond is not None and status == 200:
+            response.headers.update(cond.headers)
+            page_cache.put(cond.key, cond.version, Page(response.body, response.headers["Content-Type"]))
+        return response
+
+    def _stream_sync(self, template, context):
+        with self.flask_app.app_context():
+            return stream_template(template, **context)
+
+    async def stream(self, request, chunks, content_type, batch=64):
+        """Send a blocking iterator of str as it is produced; each batch is pulled in a worker thread."""
+        cond = _cacheable(request)
+        response = web.StreamResponse(headers=dict(cond.headers if cond else {}, **{"Content-Type": content_type}))
+        await response.prepare(request)
+        chunks = iter(chunks)
+        sent = [] if cond else None
+        while True:
+            part = await asyncio.to_thread(lambda: "".join(itertools.islice(chunks, batch)))
+            if not part:
+                break
+            data = part.encode("utf-8")
+            if sent is not None:
+                sent.append(data)
+            await response.write(data)
+        await response.write_eof()
+        if sent is not None:
+            page_cache.put(cond.key, cond.version, Page(b"".join(sent), content_type))
+        return response
+
+    def build(self) -> web.Application:
+        app = web.Application(middlewares=[self.metrics_middleware, self.session_middleware])
+        app.add_routes([
+            web.get("/login", self.login_page),
+            web.post("/login", self.login_page),
+            web.get("/logout", self.logout),
+            web.get("/", self.index),
+            web.get("/logs", self.logs),
+            web.get("/api/logs", self.api_logs),
+            web.get("/appeals", self.appeals_page),
+            web.get("/metrics", self.metrics_page),
+            web.get("/appeal_case/{user_id}/{log_id}", self.appeal_case),
+            web.post("/api/accept_appeal", self.api_accept_appeal),
+            web.post("/api/deny_appeal", self.api_deny_appeal),
+            web.post("/api/bulk_appeals", self.api_bulk_appeals),
+            web.post("/api/invite_user", self.api_invite_user),
+            web.post("/add_cmd", self.add_cmd),
+            web.post("/delete_cmd", self.delete_cmd),
+            web.post("/compact_logs", self.compact_logs),
+            web.post("/edit_cmd", self.edit_cmd),
+            web.post("/generate_cmd", self.generate_cmd),
+            web.post("/submit_appeal", self.submit_appeal),
+            web.post("/dismiss_appeal", self.dismiss_appeal),
+            web.post("/open_case", self.open_case),
+            web.get("/api/jobs/{job_id}", self.api_job),
+            web.get("/api/jobs/{job_id}/events", self.api_job_events),
+        ])
+        return app
+
+    # -- routes -----------------------------------------------------------
+
+    async def login_page(self, request):
+        if request.method == "POST":
+            form = await request.post()
+            if form.get("password") == self.password:
+                request["session"]["logged_in"] = True
+                request["session_modified"] = True
+                return _redirect("/")
+            return await self.render("login.html", error="Invalid Password")
+        return await self.render("login.html")
+
+    async def logout(self, request):
+        request["session"].pop("logged_in", None)
+        request["session_modified"] = True
+        return _redirect("/logs")
+
+    @login_required
+    async def index(self, request):
+        return await self.render("dashboard.html", commands=self.config.custom_commands,
+                                 **dashboard_status(self.bot))
+
+    @cached_page("logs")
+    async def logs(self, request):
+        # Logs are public so users can appeal
+        search_query = request.query.get("search", "").strip()
+        before = request.query.get("before") or None
+        try:
+            offset = max(0, int(request.query.get("offset", 0)))
+        except ValueError:
+            offset = 0
+        # One page: browsing is keyed by log id (newest first), ranked search results by offset
+        filtered_logs, next_page = await asyncio.to_thread(page_logs, search_query, before, offset, LOGS_PAGE_SIZE)
+
+        user_ids = {str(log["user_id"]) for log in filtered_logs if "user_id" in log}
+        usernames = await self.bot.resolve_users(user_ids) if user_ids else {}
+        if self.bot.names_pending(user_ids, usernames):
+            request["page_uncacheable"] = True     # don't freeze missing names into the cached page
+        if usernames:
+            # index entries are shared, so annotate copies
+            filtered_logs = [
+                dict(log, username=usernames[str(log["user_id"])]) if str(log.get("user_id")) in usernames else log
+                for log in filtered_logs
+            ]
+
+        next_url = "/logs?" + urlencode(next_page) if next_page else None
+        first_url = "/logs?" + urlencode({"search": search_query}) if search_query else "/logs"
+        context = dict(logs=filtered_logs, search_query=search_query, next_url=next_url,
+                       first_url=first_url if (before or offset) else None)
+        chunks = await asyncio.to_thread(self._stream_sync, "logs.html", context)
+        return await self.stream(request, chunks, "text/html; charset=utf-8")
+
+    @login_required
+    async def api_logs(self, request):
+        # NDJSON export; same parameters as the Flask route
+        search_query = request.query.get("search", "").strip()
+        try:
+            limit = int(request.query.get("limit", 0))
+        except ValueError:
+            limit = 0
+        if search_query:
+            records = iter(await asyncio.to_thread(search_logs, search_query))
+        else:
+            records = iter_logs(request.query.get("before") or None)
+        if limit:
+            records = itertools.islice(records, max(0, limit))
+        return await self.stream(request, ndjson_chunks(records), "application/x-ndjson", batch=1)
+
+    @login_required
+    async def metrics_page(self, request):
+        return web.Response(body=metrics.render().encode("utf-8"),
+                            headers={"Content-Type": metrics.CONTENT_TYPE})
+
+    @login_required
+    @cached_page("appeals")
+    async def appeals_page(self, request):
+        return await self.render("appeals.html", request=request, appeals=self.appeals.all())
+
+    @login_required
+    @cached_page("logs", "appeals")
+    async def appeal_case(self, request):
+        user_id = request.match_info["user_id"]
+        log_id = request.match_info["log_id"]
+        # An archived id can mean decompressing a month: keep that off the bot loop
+        log_entry = await asyncio.to_thread(get_log, log_id)
+        if not log_entry:
+            return web.Response(text="Log not found", status=404)
+        appeal = self.appeals.get(user_id, log_id)
+        return await self.render("appeal_case.html", request=request, user_id=user_id, log_id=log_id, log_entry=log_entry, appeal=appeal)
+
+    @login_required
+    async def api_accept_appeal(self, request):
+        form = await request.post()
+        user_id = form.get("user_id")
+        log_id = form.get("log_id")
+        action = form.get("action")
+        reason = form.get("reason") or "Appeal accepted"
+        if not user_id or not log_id or not action:
+            return _json({"status": "error", "message": "Missing fields"}, 400)
+
+        success, result = await accept_appeal(self.bot, user_id, log_id, action, reason)
+        if success:
+            return _json({"status": "success", "message": result})
+        return _json({"status": "error", "message": result}, 500)
+
+    @login_required
+    async def api_deny_appeal(self, request):
+        form = await request.post()
+        user_id = form.get("user_id")
+        log_id = form.get("log_id")
+        reason = form.get("reason") or "No reason given"
+        if not user_id or not log_id:
+            return _json({"status": "error", "message": "Missing fields"}, 400)
+
+        success, result = await deny_appeal(self.bot, user_id, log_id, reason)
+        if success:
+            return _json({"status": "success", "message": result})
+        return _json({"status": "error", "message": result}, 500)
+
+    @login_required
+    async def api_bulk_appeals(self, request):
+        try:
+            payload = await request.json()
+        except ValueError:
+            payload = None
+        error = bulk_request_error(payload)
+        if error:
+            return _json({"status": "error", "message": error}, 400)
+
+        appeals = payload["appeals"]
+        # A job, as in the Flask route: a slow batch keeps running (and keeps its report) past this request
+        job = self.bot.jobs.submit("bulk", lambda job: process_appeals(self.bot, appeals, payload["decision"],
+                                                                       payload.get("action", "unban"),
+                                                                       payload.get("reason")),
+                                   label=f"{payload['decision']} {len(appeals)}")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + 10 + len(appeals)
+        while not job.done and loop.time() < deadline:
+            await asyncio.sleep(0.2)
+        snapshot = job.snapshot()
+        if snapshot["status"] == "error":
+            return _json({"status": "error", "message": snapshot["error"], "job_id": job.id}, 500)
+        if snapshot["status"] != "done":
+            return _json({"status": "accepted", "job_id": job.id,
+                          "message": "Still running; follow /api/jobs/<job_id> for the results"}, 202)
+        report = snapshot["result"]
+        succeeded = sum(1 for r in report if r["status"] == "success")
+        return _json({"status": "success", "succeeded": succeeded, "failed": len(report) - succeeded, "results": report})
+
+    @login_required
+    async def api_invite_user(self, request):
+        form = await request.post()
+        user_id = form.get("user_id")
+        if not user_id:
+            return _json({"status": "error", "message": "Missing user_id"}, 400)
+        await notify_user_of_appeal(self.bot, user_id, self.config.application_invite_link)
+        return _json({"status": "success", "message": "Invite sent."})
+
+    @login_required
+    async def add_cmd(self, request):
+        form = await request.post()
+        name = form.get("name", "").strip().lower()
+        script = form.get("script", "").strip()
+        if not name or not script:
+            return _json({"status": "error", "message": "Invalid name or script"}, 400)
+        try:
+            await self.bot.save_command(name, script)
+        except SyntaxError as e:
+            return _json({"status": "error", "message": f"Compile error: {e}"}, 400)
+        return _json({"status": "success"})
+
+    @login_required
+    async def delete_cmd(self, request):
+        form = await request.post()
+        name = form.get("name", "").strip().lower()
+        if await self.bot.delete_custom_command(name):
+            return _json({"status": "success"})
+        return _json({"status": "error", "message": "Command not found"}, 404)
+
+    @login_required
+    async def compact_logs(self, request):
+        try:
+            summary = await asyncio.to_thread(compact_logs, self.config.get("log_retention_months", 0))
+        except Exception as e:
+            logging.error(f"Log compaction failed: {e}")
+            return _json({"status": "error", "message": str(e)}, 500)
+        return _json({"status": "success", "summary": summary})
+
+    @login_required
+    async def edit_cmd(self, request):
+        form = await request.post()
+        old_name = form.get("old_name", "").strip().lower()
+        new_name = form.get("name", "").strip().lower()
+        new_script = form.get("script", "").strip()
+        if not old_name or not new_name or not new_script:
+            return _json({"status": "error", "message": "All fields required"}, 400)
+        if old_name not in self.config.custom_commands:
+            return _json({"status": "error", "message": "Command not found"}, 404)
+        try:
+            await self.bot.save_command(new_name, new_script, replaces=old_name)
+        except SyntaxError as e:
+            return _json({"status": "error", "message": f"Compile error: {e}"}, 400)
+        logging.info(f"Updated command {old_name} to {new_name}")
+        return _json({"status": "success"})
+
+    @login_required
+    async def generate_cmd(self, request):
+        form = await request.post()
+        name = form.get("name", "").strip().lower()
+        description = form.get("description", "").strip()
+        if not name or not description:
+            return _json({"status": "error", "message": "Name and description required"}, 400)
+        job = self.bot.jobs.submit("generate", lambda job: generate_command(self.bot, name, description, progress=job.step),
+                                   label=name)
+        return _json({"status": "accepted", "job_id": job.id, "message": "Generating..."}, 202)
+
+    async def submit_appeal(self, request):
+        # Public route
+        form = await request.post()
+        log_id = form.get("log_id")
+        appeal_text = form.get("appeal_text")
+        if not log_id or not appeal_text:
+            return _json({"status": "error", "message": "Missing fields"}, 400)
+        if not await asyncio.to_thread(file_appeal, log_id, appeal_text):
+            return _json({"status": "error", "message": "Invalid Log ID"}, 400)
+        return _json({"status": "success", "message": "Appeal submitted"})
+
+    @login_required
+    async def dismiss_appeal(self, request):
+        form = await request.post()
+        user_id = form.get("user_id")
+        log_id = form.get("log_id")
+        if not user_id or not log_id:
+            return _json({"status": "error", "message": "Missing IDs"}, 400)
+        if await asyncio.to_thread(self.appeals.delete, user_id, log_id) is None:
+            return _json({"status": "error", "message": "Appeal not found"}, 404)
+        return _json({"status": "success", "message": "Appeal dismissed"})
+
+    @login_required
+    async def open_case(self, request):
+        form = await request.post()
+        user_id = form.get("user_id")
+        log_id = form.get("log_id")
+        if not user_id or not log_id:
+            return _json({"status": "error", "message": "Missing IDs"}, 400)
+        job = self.bot.jobs.submit("open_case", lambda job: open_appeal_case(self.bot, user_id, log_id, progress=job.step),
+                                   label=f"{user_id}/{log_id}")
+        return _json({"status": "accepted", "job_id": job.id, "message": "Opening case..."}, 202)
+
+    @login_required
+    async def api_job(self, request):
+        job = self.bot.jobs.get(request.match_info["job_id"])
+        if not job:
+            return _json({"status": "error", "message": "Job not found"}, 404)
+        return _json(job.snapshot())
+
+    @login_required
+    async def api_job_events(self, request, timeout=120, keepalive=15):
+        job = self.bot.jobs.get(request.match_info["job_id"])
+        if not job:
+            return _json({"status": "error", "message": "Job not found"}, 404)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        # Jobs run on this same loop, so a short poll of job.version is cheap
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        last_sent = loop.time()
+        seen = -1
+        while loop.time() < deadline:
+            if job.version != seen:
+                seen = job.version
+                await response.write(sse_event(job).encode("utf-8"))
+                last_sent = loop.time()
+                if job.done:
+                    break
+            elif loop.time() - last_sent > keepalive:
+                await response.write(b": keepalive\n\n")
+                last_sent = loop.time()
+            await asyncio.sleep(0.2)
+        await response.write_eof()
+        return response
+
+
+async def start_dashboard(bot, flask_app, password, host="0.0.0.0", port=5000) -> web.AppRunner:
+    """Serve the dashboard on the running loop. Call runner.cleanup() on shutdown."""
+    runner = web.AppRunner(AsyncDashboard(bot, flask_app, password).build())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Async dashboard listening on http://{host}:{port}")
+    return runner
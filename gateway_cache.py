@@ -0,0 +1,129 @@
+# gateway_cache.py
+"""
+How much of Discord's state the bot keeps in memory.
+
+member_cache (config):
+    "all"     every member the intents allow (discord.py's default)
+    "joined"  only members seen joining or chunked, no voice-only members
+    "voice"   only members in voice channels
+    "none"    no member cache; users are still fetched on demand
+
+chunk_members (config):
+    "startup" request every guild's member list before on_ready (default)
+    "lazy"    become ready first, then chunk guilds one at a time in the background
+    "off"     never chunk
+
+auto_shard (config) runs the bot as an AutoShardedBot.
+
+Nothing in the moderation flows needs cached members: users are resolved
+through bot.fetch_user (single-flight + username cache) and unbans/thread
+adds only need the id.
+"""
+import asyncio
+import logging
+import os
+import sys
+from typing import Dict, List
+
+import discord
+
+MEMBER_CACHE_POLICIES = ("all", "joined", "voice", "none")
+CHUNK_MODES = ("startup", "lazy", "off")
+LAZY_CHUNK_DELAY = 1.0          # seconds between guilds, keeps the gateway quiet
+
+
+def _member_cache_flags(policy: str, intents: discord.Intents) -> discord.MemberCacheFlags:
+    if policy == "none":
+        return discord.MemberCacheFlags.none()
+    if policy == "joined":
+        return discord.MemberCacheFlags(joined=True, voice=False)
+    if policy == "voice":
+        return discord.MemberCacheFlags(joined=False, voice=intents.voice_states)
+    return discord.MemberCacheFlags.from_intents(intents)
+
+
+def client_options(config, intents: discord.Intents) -> Dict:
+    """Extra keyword arguments for the Bot constructor, from config."""
+    policy = config.get('member_cache', 'all')
+    if policy not in MEMBER_CACHE_POLICIES:
+        logging.error(f"Unknown member_cache {policy!r}, using 'all'")
+        policy = 'all'
+    flags = _member_cache_flags(policy, intents)
+    chunk = config.get('chunk_members', 'startup')
+    if chunk not in CHUNK_MODES:
+        logging.error(f"Unknown chunk_members {chunk!r}, using 'startup'")
+        chunk = 'startup'
+    options = {
+        'member_cache_flags': flags,
+        # Chunking only fills the member cache, so there is nothing to do without one
+        'chunk_guilds_at_startup': chunk == 'startup' and intents.members and flags.joined,
+    }
+    if config.get('auto_shard', False) and config.get('shard_count'):
+        options['shard_count'] = int(config.get('shard_count'))
+    return options
+
+
+def wants_lazy_chunking(config, flags: discord.MemberCacheFlags) -> bool:
+    return config.get('chunk_members', 'startup') == 'lazy' and flags.joined
+
+
+async def chunk_lazily(bot) -> None:
+    """Fill the member cache after startup, one guild at a time."""
+    for guild in list(bot.guilds):
+        if guild.chunked or bot.is_closed():
+            continue
+        try:
+            await guild.chunk(cache=True)
+        except Exception as e:
+            logging.error(f"Failed to chunk guild {guild.id}: {e}")
+        await asyncio.sleep(LAZY_CHUNK_DELAY)
+
+
+def shard_status(bot) -> List[Dict]:
+    """Latency per shard (a single entry when not sharded)."""
+    shards = []
+    latencies = getattr(bot, 'latencies', None)
+    if latencies is None:
+        latencies = [(bot.shard_id or 0, bot.latency)]
+    for shard_id, latency in latencies:
+        shard = bot.get_shard(shard_id) if hasattr(bot, 'get_shard') else None
+        shards.append({
+            "id": shard_id,
+            "latency_ms": round(latency * 1000, 1) if latency == latency and latency != float('inf') else None,
+            "guilds": sum(1 for g in bot.guilds if g.shard_id == shard_id),
+            "closed": shard.is_closed() if shard is not None else bot.is_closed(),
+        })
+    return shards
+
+
+def _rss_kb():
+    """Current resident set size, or the peak where the current value isn't available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:                 # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def memory_report(bot) -> Dict:
+    """What the process holds: RSS and the size of Discord's caches."""
+    guilds = bot.guilds
+    flags = bot._connection.member_cache_flags
+    return {
+        "rss_kb": _rss_kb(),
+        "guilds": len(guilds),
+        "members_cached": sum(len(g.members) for g in guilds),
+        "members_total": sum(g.member_count or 0 for g in guilds),
+        "chunked": sum(1 for g in guilds if g.chunked),
+        "users": len(bot.users),
+        "channels": sum(len(g.channels) + len(g.threads) for g in guilds),
+        "messages": len(bot.cached_messages),
+        "member_cache": [name for name in ("joined", "voice") if getattr(flags, name)] or ["none"],
+        "shards": shard_status(bot),
+    }
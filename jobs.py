@@ -0,0 +1,175 @@
+# jobs.py
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "error"
+
+
+class Job:
+    """
+    One background action. Steps report progress through step(); every
+    change bumps *version* and wakes anyone waiting in wait_for_change().
+    """
+
+    def __init__(self, kind: str, label: str = ""):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.label = label
+        self.status = QUEUED
+        self.steps: "OrderedDict[str, Dict]" = OrderedDict()
+        self.result = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.version = 0
+        self._cond = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def _update(self, **fields) -> None:
+        # Under the condition's lock so snapshot() (Flask threads) never sees half a change
+        with self._cond:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self._cond.notify_all()
+
+    def step(self, name: str, status: str = RUNNING, detail: str = "") -> None:
+        """Record progress of one named step (running / done / error)."""
+        with self._cond:
+            self.steps[name] = {"name": name, "status": status, "detail": detail}
+            self._update()
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "label": self.label,
+                "status": self.status,
+                "steps": [dict(s) for s in self.steps.values()],
+                "result": self.result,
+                "error": self.error,
+                "created": self.created,
+                "finished": self.finished,
+                "version": self.version,
+            }
+
+    def wait_for_change(self, seen_version: int, timeout: float) -> bool:
+        """Block (in a worker thread) until version moves past *seen_version*."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.version > seen_version, timeout=timeout)
+
+
+class JobManager:
+    """
+    Runs slow dashboard actions on the bot loop without holding a request open.
+    submit() returns the job at once; the dashboard polls /api/jobs/<id> or
+    follows /api/jobs/<id>/events. Finished jobs are kept for *ttl* seconds.
+    """
+
+    def __init__(self, bot, ttl: float = 3600, max_jobs: int = 500):
+        self.bot = bot
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, work: Callable[[Job], Awaitable], label: str = "") -> Job:
+        """Schedule work(job) on the bot loop. Safe to call from any thread."""
+        job = Job(kind, label)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        asyncio.run_coroutine_threadsafe(self._run(job, work), self.bot.loop)
+        return job
+
+    async def _run(self, job: Job, work: Callable[[Job], Awaitable]) -> None:
+        job._update(status=RUNNING)
+        try:
+            result = await work(job)
+        except Exception as e:
+            logging.error(f"Job {job.kind} {job.id} failed: {e}")
+            job._update(error=str(e), finished=time.time(), status=FAILED)
+        else:
+            # status last: done / finished are also read without the lock (JobManager._prune)
+            job._update(result=result, finished=time.time(), status=DONE)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def recent(self, limit: int = 20) -> List[Dict]:
+        with self._lock:
+            jobs = list(self._jobs.values())[-limit:]
+        return [job.snapshot() for job in reversed(jobs)]
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl
+        for job_id in [j.id for j in self._jobs.values() if j.done and j.finished < cutoff]:
+            del self._jobs[job_id]
+        while len(self._jobs) >= self.max_jobs:
+            oldest = next((j.id for j in self._jobs.values() if j.done), None)
+            if oldest is None:
+                break
+            del self._jobs[oldest]
+
+
+def sse_event(job: Job) -> str:
+    """One server-sent event carrying the job snapshot."""
+    return _sse_snapshot(job.snapshot())
+
+
+def _sse_snapshot(snapshot: Dict) -> str:
+    done = snapshot["status"] in (DONE, FAILED)
+    return f"event: {'done' if done else 'progress'}\ndata: {json.dumps(snapshot)}\n\n"
+
+
+def sse_stream(job: Job, timeout: float = 120, keepalive: float = 15) -> Iterator[str]:
+    """Blocking SSE generator for the Flask route: one event per change, ends when the job does."""
+    deadline = time.monotonic() + timeout
+    seen = -1
+    while True:
+        if job.version != seen:
+            seen = job.version
+            yield sse_event(job)
+            if job.done:
+                return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        if not job.wait_for_change(seen, min(keepalive, remaining)):
+            yield ": keepalive\n\n"
+
+
+def sse_poll_stream(fetch: Callable[[], Optional[Dict]], timeout: float = 120,
+                    interval: float = 0.5, keepalive: float = 15) -> Iterator[str]:
+    """
+    sse_stream for a job that runs in another process (dashboard workers, see
+    bot_ipc): *fetch()* returns its current snapshot, polled every *interval*.
+    """
+    deadline = time.monotonic() + timeout
+    seen = -1
+    quiet_since = time.monotonic()
+    while time.monotonic() < deadline:
+        snapshot = fetch()
+        if snapshot is None:
+            return                                  # pruned, or the bot restarted
+        if snapshot["version"] != seen:
+            seen = snapshot["version"]
+            quiet_since = time.monotonic()
+            yield _sse_snapshot(snapshot)
+            if snapshot["status"] in (DONE, FAILED):
+                return
+        elif time.monotonic() - quiet_since >= keepalive:
+            quiet_since = time.monotonic()
+            yield ": keepalive\n\n"
+        time.sleep(interval)
@@ -1,65 +1,171 @@
-# log_helper.py
-import json
-import os
-from datetime import datetime
-from typing import Dict
-
-LOGS_FILE = "logs.json"
-
-
-def _load_logs() -> list:
-    """Read the JSON file – return an empty list if the file is missing or broken."""
-    if not os.path.exists(LOGS_FILE):
-        return []
-    try:
-        with open(LOGS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        # Corrupt JSON → start fresh (you can change this behaviour if you prefer)
-        return []
-
-
-def _save_logs(logs: list) -> None:
-    """Write the whole list back to disk (pretty‑printed)."""
-    with open(LOGS_FILE, "w", encoding="utf-8") as f:
-        json.dump(logs, f, indent=4)
-
-
-def _next_id(logs: list) -> str:
-    """
-    Determine the next numeric ID.
-    Existing entries may or may not have an 'id' key – we ignore those that don’t.
-    Returns the new ID as a **string**, matching the format used elsewhere.
-    """
-    max_id = 0
-    for entry in logs:
-        try:
-            cur = int(entry.get("id", 0))
-            if cur > max_id:
-                max_id = cur
-        except ValueError:
-            continue
-    return str(max_id + 1)
-
-
-def add_log(entry: Dict) -> None:
-    """
-    Append a new moderation entry to logs.json.
-    Expected keys in *entry*: type, user_id, reason, timestamp.
-    This function adds the missing 'id' field automatically.
-    """
-    logs = _load_logs()
-
-    # Insert the generated id
-    entry_with_id = dict(entry)               # copy so we don’t mutate caller’s dict
-    entry_with_id["id"] = _next_id(logs)
-
-    # Newest entries first – the UI expects that order
-    logs.insert(0, entry_with_id)
-    _save_logs(logs)
+# log_helper.py
+import json
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from log_search import note_usernames, forget_username
+from log_store import LogStore, open_store
+
+_store: Optional[LogStore] = None
+
+# Entries per /logs page
+PAGE_SIZE = 50
+
+# (type, user_id) -> when the bot last logged that action; lets gateway
+# ingestion (moderation_events) skip actions the bot records itself
+_recent: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+_recent_lock = threading.Lock()
+RECENT_LIMIT = 5000
+
+
+def set_store(store: LogStore) -> None:
+    """Swap the storage engine (bot.py picks one from config.json at startup)."""
+    global _store
+    if _store is not None and _store is not store:
+        _store.close()
+    _store = store
+
+
+def get_store() -> LogStore:
+    global _store
+    if _store is None:
+        _store = open_store()
+    return _store
+
+
+def add_log(entry: Dict) -> None:
+    """
+    Append a new moderation entry to the log store.
+    Expected keys in *entry*: type, user_id, reason, timestamp.
+    This function adds the missing 'id' field automatically.
+    """
+    get_store().append(entry)
+    mark_logged(entry.get("type"), entry.get("user_id"))
+
+
+def add_logs(entries: List[Dict], mark: bool = True) -> List[Dict]:
+    """
+    add_log for a batch, written in one go. Returns the stored records (with ids).
+    mark=False for entries that record someone else's action (moderation_events).
+    Called on an event loop, the sqlite engine writes later and the ids appear on
+    the returned records once it has; coroutines call this via asyncio.to_thread.
+    """
+    records = get_store().append_many(entries)
+    if mark:
+        for entry in entries:
+            mark_logged(entry.get("type"), entry.get("user_id"))
+    return records
+
+
+def mark_logged(log_type, user_id) -> None:
+    """
+    Note that the bot logs this action itself. add_log does this; call it
+    directly when the entry is only written later (e.g. a bulk accept).
+    """
+    key = (str(log_type), str(user_id))
+    with _recent_lock:
+        _recent[key] = time.monotonic()
+        _recent.move_to_end(key)
+        while len(_recent) > RECENT_LIMIT:
+            _recent.popitem(last=False)
+
+
+def unmark_logged(log_type, user_id) -> None:
+    """Undo mark_logged, e.g. when the action it announced failed."""
+    with _recent_lock:
+        _recent.pop((str(log_type), str(user_id)), None)
+
+
+def logged_recently(log_type, user_id, within: float) -> bool:
+    """True if the bot logged (type, user_id) in the last *within* seconds."""
+    with _recent_lock:
+        at = _recent.get((str(log_type), str(user_id)))
+    return at is not None and time.monotonic() - at <= within
 
 
 def get_log(log_id: str) -> Dict:
     """Retrieve a single log entry by its ID."""
-    logs = _load_logs()
-    return next((log for log in logs if log.get("id") == log_id), None)
\ No newline at end of file
+    return get_store().get(log_id)
+
+
+def get_logs() -> List[Dict]:
+    """All log entries, newest first. Entries are shared – copy before modifying."""
+    return get_store().all()
+
+
+def iter_logs(before: Optional[str] = None) -> Iterator[Dict]:
+    """Every entry newest first (archived months included), below id *before*. Lazy."""
+    return get_store().iter_newest(before)
+
+
+def page_logs(search_query: str = "", before: Optional[str] = None, offset: int = 0,
+              limit: int = PAGE_SIZE) -> Tuple[List[Dict], Optional[Dict]]:
+    """
+    One page of /logs and the query parameters of the next page (None on the last).
+    Browsing is keyed by log id (newest first, stable while entries are added);
+    ranked search results page by offset.
+    """
+    if search_query:
+        results = search_logs(search_query)
+        page = results[offset:offset + limit]
+        more = len(results) > offset + limit
+        return page, ({"search": search_query, "offset": offset + limit} if more else None)
+    page = list(islice(iter_logs(before), limit + 1))
+    if len(page) > limit:
+        return page[:limit], {"before": page[limit - 1]["id"]}
+    return page, None
+
+
+def ndjson_chunks(records, chunk_size: int = 500) -> Iterator[str]:
+    """Serialize *records* as NDJSON, *chunk_size* lines per yielded string."""
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in chunk)
+
+
+def get_user_logs(user_id: str) -> List[Dict]:
+    """Log entries for one user, newest first."""
+    return get_store().for_user(user_id)
+
+
+def search_logs(query: str) -> List[Dict]:
+    """
+    Ranked search over reason, type, usernames and user ids, with
+    type:/user:/after:/before: filters (see log_search). Best match first.
+    """
+    return get_store().search(query)
+
+
+def index_usernames(names: Dict) -> None:
+    """Make resolved {user_id: username} pairs searchable."""
+    note_usernames(names)
+
+
+def unindex_username(user_id) -> None:
+    """Stop matching a user's name in searches (the name cache dropped it)."""
+    forget_username(user_id)
+
+
+def rotate_logs() -> int:
+    """Archive entries from closed months. Cheap when there is nothing to do."""
+    return get_store().rotate()
+
+
+def compact_logs(retention_months: int = 0) -> Dict:
+    """Archive closed months, drop archives past *retention_months* and rebuild the manifest."""
+    return get_store().compact(retention_months)
+
+
+def log_version():
+    """(change counter, last change time) of the log, or None if the engine can't tell."""
+    return get_store().version()
+
+
+def log_storage_stats() -> Dict:
+    return get_store().storage_stats()
@@ -0,0 +1,248 @@
+# log_search.py
+"""
+Full-text search over moderation logs.
+
+LogIndex keeps a TextIndex (token -> positions) for the text fields of every
+record it holds; usernames aren't stored in the log, so the bot reports the
+names it resolves to the shared UsernameIndex instead.
+
+Query syntax for the /logs search box:
+    spam raid            ranked: entries matching more / rarer terms first
+    123456               digits also match user ids (substring, like before)
+    type:ban             only these types (repeat for several)
+    user:1234            user_id contains 1234
+    after:2024-05-01     timestamp on/after this prefix (before: likewise)
+"""
+import math
+import re
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+_TOKEN = re.compile(r"\w+")
+
+# Field weights: a hit in the action type or on the user says more than a word in the reason
+FIELD_WEIGHTS = {"reason": 1.0, "type": 2.0}
+NAME_WEIGHT = 2.0
+USER_ID_WEIGHT = 3.0
+MAX_USERNAMES = 10000          # UserCache's default size; the bot also drops what the cache evicts
+FILTERS = ("type", "user", "after", "before")
+
+
+def tokenize(text) -> List[str]:
+    return _TOKEN.findall(str(text).lower())
+
+
+def parse_query(text: str) -> Tuple[List[str], Dict[str, List[str]]]:
+    """Split a search string into free-text terms and field:value filters."""
+    terms, filters = [], {}
+    for part in text.split():
+        field, sep, value = part.partition(":")
+        field = field.lower()
+        if sep and value and field in FILTERS:
+            filters.setdefault(field, []).append(value.lower())
+        else:
+            terms.extend(tokenize(part))
+    return terms, filters
+
+
+class TextIndex:
+    """Per-field inverted index. Postings are ascending record positions in compact arrays."""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, array]] = {field: {} for field in FIELD_WEIGHTS}
+
+    def add(self, position: int, record: Dict) -> None:
+        for field, index in self.postings.items():
+            value = record.get(field)
+            if value is None:
+                continue
+            for token in set(tokenize(value)):
+                positions = index.get(token)
+                if positions is None:
+                    positions = index[token] = array("I")
+                positions.append(position)
+
+    def lookup(self, field: str, token: str) -> Optional[array]:
+        return self.postings[field].get(token)
+
+
+class UsernameIndex:
+    """
+    user_id -> resolved username, searchable by name-token prefix.
+    Lives outside LogIndex so it survives index rebuilds and segment rotation.
+    Bounded like the UserCache it mirrors: least recently noted names go first.
+    """
+
+    def __init__(self, max_size: int = MAX_USERNAMES):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._names: "OrderedDict[str, str]" = OrderedDict()
+        self._users: Dict[str, Set[str]] = {}      # token -> user ids
+        self._tokens: List[str] = []               # sorted, for prefix lookups
+
+    def note(self, user_id, name: Optional[str]) -> None:
+        user_id = str(user_id)
+        with self._lock:
+            old = self._names.get(user_id)
+            if old == name:
+                if old:
+                    self._names.move_to_end(user_id)
+                return
+            self._drop(user_id)
+            if not name:
+                return
+            self._names[user_id] = name
+            for token in set(tokenize(name)):
+                users = self._users.get(token)
+                if users is None:
+                    users = self._users[token] = set()
+                    insort(self._tokens, token)
+                users.add(user_id)
+            while len(self._names) > self.max_size:
+                self._drop(next(iter(self._names)))
+
+    def forget(self, user_id) -> None:
+        with self._lock:
+            self._drop(str(user_id))
+
+    def _drop(self, user_id: str) -> None:
+        old = self._names.pop(user_id, None)
+        if not old:
+            return
+        for token in set(tokenize(old)):
+            users = self._users.get(token)
+            if users is None:
+                continue
+            users.discard(user_id)
+            if not users:                          # keep _tokens from growing with names long gone
+                del self._users[token]
+                del self._tokens[bisect_left(self._tokens, token)]
+
+    def match(self, prefix: str) -> Set[str]:
+        """User ids whose name has a token starting with *prefix*."""
+        found = set()
+        with self._lock:
+            i = bisect_left(self._tokens, prefix)
+            while i < len(self._tokens) and self._tokens[i].startswith(prefix):
+                found |= self._users[self._tokens[i]]
+                i += 1
+        return found
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._names)
+
+
+usernames = UsernameIndex()
+
+
+def note_usernames(names: Dict) -> None:
+    """Feed resolved {user_id: username} pairs into the search index."""
+    for user_id, name in names.items():
+        usernames.note(user_id, name)
+
+
+def forget_username(user_id) -> None:
+    """Drop a user the name cache no longer holds."""
+    usernames.forget(user_id)
+
+
+def _positions_for_users(log_index, user_ids: Iterable[str]) -> List[int]:
+    positions = []
+    for user_id in user_ids:
+        positions.extend(log_index.by_user.get(user_id, ()))
+    return positions
+
+
+def search(log_index, query: str, names: UsernameIndex = usernames) -> List[Dict]:
+    """Run *query* against a LogIndex. Ranked by score, then newest first."""
+    terms, filters = parse_query(query)
+    if not terms and not filters:
+        return log_index.newest_first()
+    records = log_index.records
+    total = len(records)
+    if not total:
+        return []
+
+    scores: Dict[int, float] = {}
+    for term in dict.fromkeys(terms):                     # de-duplicated, order kept
+        sources = []
+        for field, weight in FIELD_WEIGHTS.items():
+            positions = log_index.text.lookup(field, term)
+            if positions:
+                sources.append((positions, weight))
+        user_ids = names.match(term)
+        if term.isdigit():
+            user_ids |= log_index.matching_user_ids(term)
+            weight = USER_ID_WEIGHT
+        else:
+            weight = NAME_WEIGHT
+        if user_ids:
+            sources.append((_positions_for_users(log_index, user_ids), weight))
+        if not sources:
+            continue
+        # Rare terms count for more (idf), so "raid spam" ranks raid hits first
+        matches = sum(len(p) for p, _ in sources)
+        idf = math.log(1 + total / matches)
+        for positions, weight in sources:
+            gain = weight * idf
+            for position in positions:
+                scores[position] = scores.get(position, 0.0) + gain
+
+    if terms:
+        candidates: Iterable[int] = scores.keys()
+    elif "user" in filters or "type" in filters:
+        candidates = _filter_candidates(log_index, filters)
+    else:
+        candidates = range(total)
+
+    keep = _filter_predicate(log_index, filters)
+    if keep is not None:
+        candidates = [p for p in candidates if keep(records[p])]
+
+    if terms:
+        ordered = sorted(candidates, key=lambda p: (scores[p], p), reverse=True)
+    else:
+        ordered = sorted(candidates, reverse=True)
+    return [records[p] for p in ordered]
+
+
+def _filter_candidates(log_index, filters) -> Set[int]:
+    """Positions narrowed by the indexed filters, used when the query has no free text."""
+    sets = []
+    if "type" in filters:
+        found = set()
+        for value in filters["type"]:
+            for token in tokenize(value):
+                found.update(log_index.text.lookup("type", token) or ())
+        sets.append(found)
+    if "user" in filters:
+        found = set()
+        for value in filters["user"]:
+            found.update(_positions_for_users(log_index, log_index.matching_user_ids(value)))
+        sets.append(found)
+    return set.intersection(*sets)
+
+
+def _filter_predicate(log_index, filters):
+    checks = []
+    if "type" in filters:
+        types = set(filters["type"])
+        checks.append(lambda r: str(r.get("type", "")).lower() in types)
+    if "user" in filters:
+        users = set()
+        for value in filters["user"]:
+            users |= log_index.matching_user_ids(value)
+        checks.append(lambda r: str(r.get("user_id", "")) in users)
+    if "after" in filters:
+        after = max(filters["after"])
+        checks.append(lambda r: str(r.get("timestamp", "")) >= after)
+    if "before" in filters:
+        before = min(filters["before"])
+        checks.append(lambda r: str(r.get("timestamp", ""))[:len(before)] < before)
+    if not checks:
+        return None
+    return lambda record: all(check(record) for check in checks)
@@ -0,0 +1,745 @@
+# log_store.py
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import log_search
+from persistence import get_worker, flush as flush_writes
+
+LOGS_FILE = "logs.jsonl"
+SEQ_FILE = "logs.seq"
+LEGACY_LOGS_FILE = "logs.json"
+ARCHIVE_DIR = "logs_archive"
+MANIFEST_FILE = "manifest.json"
+UNDATED = "0000-00"            # month of records without a usable timestamp (sqlite_store)
+
+
+class LogStore(ABC):
+    """
+    Storage engine behind log_helper.add_log / get_log.
+    Engines only ever append; ids are numeric strings handed out by the engine.
+    """
+
+    @abstractmethod
+    def append(self, entry: Dict) -> Dict:
+        """Persist *entry* with a freshly generated 'id' and return the stored record."""
+
+    def append_many(self, entries: List[Dict]) -> List[Dict]:
+        """append() for a batch; engines override this to write the batch together."""
+        return [self.append(entry) for entry in entries]
+
+    @abstractmethod
+    def get(self, log_id: str) -> Optional[Dict]:
+        """The record with this id, or None."""
+
+    @abstractmethod
+    def all(self) -> List[Dict]:
+        """Every record, newest first – the UI expects that order."""
+
+    def for_user(self, user_id: str) -> List[Dict]:
+        """Records for one user_id, newest first."""
+        return [log for log in self.all() if str(log.get("user_id", "")) == str(user_id)]
+
+    def search_user_id(self, fragment: str) -> List[Dict]:
+        """Records whose user_id contains *fragment* (case-insensitive), newest first."""
+        fragment = fragment.lower()
+        return [log for log in self.all() if fragment in str(log.get("user_id", "")).lower()]
+
+    def search(self, query: str) -> List[Dict]:
+        """Ranked full-text search (see log_search for the syntax)."""
+        return log_search.search(LogIndex(self.all()[::-1]), query)
+
+    def iter_newest(self, before: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Records newest first (by id), starting below id *before*, including
+        archived ones. Lazy, so paging and exports never build the full list.
+        """
+        limit = _record_id({"id": before}) if before else None
+        for record in self.all():
+            if limit is None or (_record_id(record) or 0) < limit:
+                yield record
+
+    def rotate(self) -> int:
+        """Move records from closed periods out of the hot set. Returns how many moved."""
+        return 0
+
+    def compact(self, retention_months: int = 0) -> Dict:
+        """rotate(), drop archives past *retention_months* (0 keeps everything), rebuild indexes."""
+        return {}
+
+    def storage_stats(self) -> Dict:
+        return {}
+
+    def version(self) -> Optional[Tuple[int, float]]:
+        """
+        (change counter, time of the last change) – moves whenever what the
+        UI shows could have changed. None if the engine can't tell, which
+        turns off page caching for the log views.
+        """
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+class LogIndex:
+    """
+    In-memory view of the log shared by every request.
+    Records are kept oldest first and handed out as-is, so callers must treat them as read-only.
+    """
+
+    def __init__(self, records: List[Dict] = ()):
+        self.records: List[Dict] = []
+        self.by_id: Dict[str, Dict] = {}
+        self.by_user: Dict[str, List[int]] = {}     # user_id -> positions in self.records
+        # Every suffix of every distinct user_id, sorted: a substring match is
+        # a prefix match on some suffix, which is a bisect instead of a scan.
+        self._suffixes: List[Tuple[str, str]] = []
+        self.text = log_search.TextIndex()          # reason/type tokens -> positions
+        for record in records:
+            self._add(record, sort=False)
+        self._suffixes.sort()
+
+    def add(self, record: Dict) -> None:
+        self._add(record, sort=True)
+
+    def _add(self, record: Dict, sort: bool) -> None:
+        position = len(self.records)
+        self.records.append(record)
+        if "id" in record:
+            self.by_id[record["id"]] = record
+        self.text.add(position, record)
+        if "user_id" not in record:
+            return
+        user_id = str(record["user_id"])
+        postings = self.by_user.get(user_id)
+        if postings is None:
+            postings = self.by_user[user_id] = []
+            key = user_id.lower()
+            for i in range(len(key)):
+                if sort:
+                    insort(self._suffixes, (key[i:], user_id))
+                else:
+                    self._suffixes.append((key[i:], user_id))
+        postings.append(position)
+
+    def newest_first(self) -> List[Dict]:
+        return self.records[::-1]
+
+    def iter_newest(self, before: Optional[int] = None) -> Iterator[Dict]:
+        """Newest first, only ids below *before*. Ids grow with position, so this is a bisect."""
+        records = self.records
+        end = len(records)
+        if before is not None:
+            lo, hi = 0, end
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if (_record_id(records[mid]) or 0) < before:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            end = lo
+        for position in range(end - 1, -1, -1):
+            yield records[position]
+
+    def for_user(self, user_id: str) -> List[Dict]:
+        return [self.records[p] for p in reversed(self.by_user.get(str(user_id), []))]
+
+    def matching_user_ids(self, fragment: str) -> set:
+        """Distinct user_ids containing *fragment* (case-insensitive)."""
+        fragment = fragment.lower()
+        users = set()
+        i = bisect_left(self._suffixes, (fragment, ""))
+        while i < len(self._suffixes) and self._suffixes[i][0].startswith(fragment):
+            users.add(self._suffixes[i][1])
+            i += 1
+        return users
+
+    def search_user_id(self, fragment: str) -> List[Dict]:
+        users = self.matching_user_ids(fragment)
+        positions = sorted((p for user_id in users for p in self.by_user[user_id]), reverse=True)
+        return [self.records[p] for p in positions]
+
+    def search(self, query: str) -> List[Dict]:
+        return log_search.search(self, query)
+
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _max_id(records: List[Dict]) -> int:
+    max_id = 0
+    for entry in records:
+        try:
+            max_id = max(max_id, int(entry.get("id", 0)))
+        except (TypeError, ValueError):
+            continue
+    return max_id
+
+
+_MONTH = re.compile(r"^\d{4}-\d{2}")
+
+
+def month_of(record: Dict) -> Optional[str]:
+    """'YYYY-MM' from the record's timestamp, or None."""
+    match = _MONTH.match(str(record.get("timestamp", "")))
+    return match.group(0) if match else None
+
+
+def _current_month(now: Optional[datetime] = None) -> str:
+    # UTC, like the log timestamps – local time would close a month hours early or late
+    return (now or datetime.now(timezone.utc)).strftime("%Y-%m")
+
+
+def _now_timestamp() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _segment_months(records: List[Dict], current: str) -> List[str]:
+    """
+    The month each record belongs to. An undated record takes the month of
+    the nearest dated record before it, else after it; with neither it
+    counts as current, so rotation leaves it hot.
+    """
+    months = [month_of(r) for r in records]
+    previous = None
+    for i, month in enumerate(months):
+        if month is None:
+            months[i] = previous
+        else:
+            previous = month
+    following = current                        # only a leading run of undated records is left
+    for i in range(len(months) - 1, -1, -1):
+        if months[i] is None:
+            months[i] = following
+        else:
+            following = months[i]
+    return months
+
+
+def _shift_month(month: str, delta: int) -> str:
+    year, mon = int(month[:4]), int(month[5:7])
+    total = year * 12 + (mon - 1) + delta
+    return f"{total // 12:04d}-{total % 12 + 1:02d}"
+
+
+def _record_id(record: Dict) -> Optional[int]:
+    try:
+        return int(record.get("id"))
+    except (TypeError, ValueError):
+        return None
+
+
+class SegmentArchive:
+    """
+    Closed months of the log: one gzip'd JSONL file per month
+    (logs_archive/2024-05.jsonl.gz) and a manifest with each segment's id
+    range and count. Nothing here is touched on the hot path – get() uses the
+    manifest to pick the one segment that can hold an id and only then
+    decompresses it (the last few are kept in memory).
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIR, cache_size: int = 2):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+        self.cache_size = cache_size
+        self._lock = threading.RLock()
+        self._segments: Dict[str, Dict] = {}                 # month -> manifest entry
+        self._loaded: "OrderedDict[str, Dict[str, Dict]]" = OrderedDict()
+        self._signature = None
+        self._load_manifest()
+
+    def _path(self, month: str) -> str:
+        return os.path.join(self.directory, f"{month}.jsonl.gz")
+
+    def _stat(self):
+        try:
+            st = os.stat(self.manifest_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _load_manifest(self) -> None:
+        segments = []
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                segments = json.load(f).get("segments", [])
+        except OSError:
+            pass
+        except ValueError as e:
+            logging.error(f"Corrupt {self.manifest_path}, run 'python log_store.py rebuild-manifest': {e}")
+        self._segments = {s["month"]: s for s in segments}
+        self._loaded.clear()
+        self._signature = self._stat()
+
+    def _refresh(self) -> None:
+        if self._stat() != self._signature:      # e.g. the CLI compacted under us
+            self._load_manifest()
+
+    def _save_manifest(self) -> None:
+        segments = [self._segments[m] for m in sorted(self._segments)]
+        _write_atomic(self.manifest_path, json.dumps({"segments": segments}, indent=4))
+        self._signature = self._stat()
+
+    def _read_segment(self, month: str) -> List[Dict]:
+        records = []
+        try:
+            with gzip.open(self._path(month), "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+        except (OSError, EOFError) as e:
+            # Truncated member after a crash – keep whatever decoded cleanly
+            logging.error(f"Error reading {self._path(month)}: {e}")
+        return records
+
+    def _segment_index(self, month: str) -> Dict[str, Dict]:
+        index = self._loaded.get(month)
+        if index is None:
+            index = {r["id"]: r for r in self._read_segment(month) if "id" in r}
+            self._loaded[month] = index
+            while len(self._loaded) > self.cache_size:
+                self._loaded.popitem(last=False)
+        else:
+            self._loaded.move_to_end(month)
+        return index
+
+    # -- reads ------------------------------------------------------------
+
+    def get(self, log_id: str) -> Optional[Dict]:
+        wanted = _record_id({"id": log_id})
+        if wanted is None:
+            return None                          # ids are numeric; don't decompress anything for junk
+        with self._lock:
+            self._refresh()
+            for month, entry in self._segments.items():
+                if entry.get("first_id") is None or not entry["first_id"] <= wanted <= entry["last_id"]:
+                    continue
+                record = self._segment_index(month).get(str(log_id))
+                if record is not None:
+                    return record
+        return None
+
+    def iter_newest(self, before: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Archived records newest first, only ids below *before*. One segment
+        is decoded at a time and bypasses the get() cache, so an export
+        doesn't evict the segments lookups are using.
+        """
+        with self._lock:
+            self._refresh()
+            segments = sorted(self._segments.values(), key=lambda s: s.get("last_id") or 0, reverse=True)
+        for entry in segments:
+            if before is not None and entry.get("first_id") is not None and entry["first_id"] >= before:
+                continue
+            for record in reversed(self._read_segment(entry["month"])):
+                if before is None or (_record_id(record) or 0) < before:
+                    yield record
+
+    def signature(self):
+        """Changes whenever the manifest does (ours or another process's writes)."""
+        with self._lock:
+            self._refresh()
+            return self._signature
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._refresh()
+            months = sorted(self._segments)
+            return {
+                "segments": len(months),
+                "archived": sum(s.get("count", 0) for s in self._segments.values()),
+                "oldest": months[0] if months else None,
+            }
+
+    # -- writes -----------------------------------------------------------
+
+    def add(self, records: List[Dict], months: List[str]) -> int:
+        """
+        Append *records* (with their segment month) to the month files.
+        Ids already covered by a segment are skipped, so re-running after a
+        crash between the archive write and the hot file rewrite is harmless.
+        """
+        grouped: Dict[str, List[Dict]] = {}
+        for record, month in zip(records, months):
+            grouped.setdefault(month, []).append(record)
+        added = 0
+        with self._lock:
+            self._refresh()
+            os.makedirs(self.directory, exist_ok=True)
+            for month, batch in grouped.items():
+                entry = self._segments.get(month) or {
+                    "month": month, "file": os.path.basename(self._path(month)),
+                    "count": 0, "first_id": None, "last_id": None,
+                }
+                if entry["last_id"] is not None:
+                    batch = [r for r in batch if (_record_id(r) or 0) == 0 or _record_id(r) > entry["last_id"]]
+                if not batch:
+                    continue
+                # Appending a new gzip member keeps the earlier ones untouched
+                with gzip.open(self._path(month), "at", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch))
+                ids = [i for i in (_record_id(r) for r in batch) if i is not None]
+                if ids:
+                    entry["first_id"] = min(ids + ([entry["first_id"]] if entry["first_id"] is not None else []))
+                    entry["last_id"] = max(ids + ([entry["last_id"]] if entry["last_id"] is not None else []))
+                entry["count"] += len(batch)
+                self._segments[month] = entry
+                self._loaded.pop(month, None)
+                added += len(batch)
+            self._save_manifest()
+        return added
+
+    def expire(self, keep_months: int, now: Optional[datetime] = None) -> List[str]:
+        """Delete segments more than *keep_months* months old. Returns the months removed."""
+        if keep_months <= 0:
+            return []
+        cutoff = _shift_month(_current_month(now), -keep_months)
+        with self._lock:
+            self._refresh()
+            removed = [m for m in sorted(self._segments) if m < cutoff]
+            for month in removed:
+                try:
+                    os.remove(self._path(month))
+                except FileNotFoundError:
+                    pass
+                del self._segments[month]
+                self._loaded.pop(month, None)
+            if removed:
+                self._save_manifest()
+        return removed
+
+    def rebuild_manifest(self) -> int:
+        """Recompute the manifest from the segment files on disk. Returns the segment count."""
+        segments = {}
+        with self._lock:
+            try:
+                names = sorted(os.listdir(self.directory))
+            except FileNotFoundError:
+                names = []
+            for name in names:
+                if not name.endswith(".jsonl.gz") or not _MONTH.match(name):
+                    continue
+                month = name[:7]
+                records = self._read_segment(month)
+                ids = [i for i in (_record_id(r) for r in records) if i is not None]
+                segments[month] = {
+                    "month": month, "file": name, "count": len(records),
+                    "first_id": min(ids) if ids else None, "last_id": max(ids) if ids else None,
+                }
+            self._segments = segments
+            self._loaded.clear()
+            os.makedirs(self.directory, exist_ok=True)
+            self._save_manifest()
+        return len(segments)
+
+
+class JsonlLogStore(LogStore):
+    """
+    One JSON record per line, oldest first, appended in place.
+    The last handed-out id lives in a tiny side file so add_log never has to scan.
+    Both are written behind by the persistence worker; the in-memory index is
+    updated immediately, so reads never wait for the disk.
+
+    The file only holds the current month: rotate() moves closed months into
+    the compressed SegmentArchive, and get() falls back to the archive for
+    ids that are no longer hot. all()/for_user()/search use a second index
+    over archive and hot records together, built on first use and rebuilt
+    only when the archive or the hot file changes behind our back.
+    """
+
+    def __init__(self, path: str = LOGS_FILE, seq_path: str = SEQ_FILE, legacy_path: str = LEGACY_LOGS_FILE,
+                 archive_dir: str = ARCHIVE_DIR):
+        self.path = path
+        self.seq_path = seq_path
+        self.legacy_path = legacy_path
+        self.archive = SegmentArchive(archive_dir)
+        self._lock = threading.RLock()
+        self._index: Optional[LogIndex] = None
+        self._signature = None
+        self._full: Optional[LogIndex] = None       # archive + hot, see _searchable()
+        self._full_basis = None                    # (archive signature, hot index) it was built from
+        self._unflushed = 0        # appends queued but not yet on disk
+        self._changes = 0          # see version()
+        self._changed_at = time.time()
+        self._archive_signature = None
+        if not os.path.exists(self.path) and os.path.exists(self.legacy_path):
+            self._migrate()
+        self._seq = self._load_seq()
+
+    # -- id counter -------------------------------------------------------
+
+    def _load_seq(self) -> int:
+        seq = 0
+        try:
+            with open(self.seq_path, "r", encoding="utf-8") as f:
+                seq = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            pass
+        # A crash between the record write and the counter write leaves the
+        # counter one behind – the last line is the source of truth then.
+        last = self._last_record()
+        if last:
+            seq = max(seq, _max_id([last]))
+        return seq
+
+    def _last_record(self) -> Optional[Dict]:
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                f.seek(max(0, size - 65536))
+                tail = f.read().splitlines()
+        except OSError:
+            return None
+        for raw in reversed(tail):
+            try:
+                return json.loads(raw)
+            except ValueError:
+                continue  # torn or partial line
+        return None
+
+    # -- migration --------------------------------------------------------
+
+    def _migrate(self) -> None:
+        """One-time import of the old newest-first logs.json array."""
+        try:
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except Exception as e:
+            logging.error(f"Could not migrate {self.legacy_path}: {e}")
+            return
+        if not isinstance(legacy, list):
+            logging.error(f"Could not migrate {self.legacy_path}: expected a list")
+            return
+
+        records = list(reversed(legacy))
+        _write_atomic(self.path, "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+        _write_atomic(self.seq_path, str(_max_id(records)))
+        os.replace(self.legacy_path, self.legacy_path + ".bak")
+        logging.info(f"Migrated {len(records)} log entries from {self.legacy_path} to {self.path}")
+
+    # -- index ------------------------------------------------------------
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _indexed(self) -> LogIndex:
+        """The shared index, rebuilt only when the file changed behind our back."""
+        signature = self._stat()
+        with self._lock:
+            if self._index is None or (not self._unflushed and signature != self._signature):
+                self._index = LogIndex(self._read())
+                self._signature = signature
+                self._changed()
+                # another writer may have handed out ids since we last looked
+                self._seq = max(self._seq, _max_id(self._index.records[-1:]))
+            return self._index
+
+    def _changed(self) -> None:
+        self._changes += 1
+        self._changed_at = time.time()
+
+    def _on_flushed(self) -> None:
+        with self._lock:
+            self._unflushed -= 1
+            if not self._unflushed:
+                self._signature = self._stat()
+
+    # -- LogStore ---------------------------------------------------------
+
+    def append(self, entry: Dict) -> Dict:
+        return self.append_many([entry])[0]
+
+    def append_many(self, entries: List[Dict]) -> List[Dict]:
+        records = []
+        with self._lock:
+            # Pending appends must land in an index that is already loaded,
+            # otherwise a later rebuild from disk would miss them.
+            index = self._indexed()
+            for entry in entries:
+                self._seq += 1
+                record = dict(entry)           # copy so we don’t mutate caller’s dict
+                record["id"] = str(self._seq)
+                if "timestamp" not in record:
+                    record["timestamp"] = _now_timestamp()     # rotation files records by month
+                index.add(record)
+                if self._full is not None and self._full_basis[1] is index:
+                    self._full.add(record)
+                records.append(record)
+            if not records:
+                return records
+            self._changed()
+            seq = self._seq
+            self._unflushed += 1
+            worker = get_worker()
+            worker.append_lines(self.path, [json.dumps(r, ensure_ascii=False) + "\n" for r in records], self._on_flushed)
+            worker.write_text(self.seq_path, lambda: str(seq))
+        return records
+
+    def _read(self) -> List[Dict]:
+        records = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return records
+
+    def get(self, log_id: str) -> Optional[Dict]:
+        record = self._indexed().by_id.get(log_id)
+        if record is None:
+            record = self.archive.get(log_id)
+        return record
+
+    def _searchable(self) -> LogIndex:
+        """Archived and hot records in one index, so searches reach closed months too."""
+        hot = self._indexed()
+        archive = self.archive.signature()
+        with self._lock:
+            if self._full is None or self._full_basis[0] != archive or self._full_basis[1] is not hot:
+                self._full = LogIndex(list(self.iter_newest())[::-1])
+                self._full_basis = (archive, hot)
+            return self._full
+
+    def all(self) -> List[Dict]:
+        return self._searchable().newest_first()
+
+    def for_user(self, user_id: str) -> List[Dict]:
+        return self._searchable().for_user(user_id)
+
+    def search_user_id(self, fragment: str) -> List[Dict]:
+        return self._searchable().search_user_id(fragment)
+
+    def search(self, query: str) -> List[Dict]:
+        return self._searchable().search(query)
+
+    def iter_newest(self, before: Optional[str] = None) -> Iterator[Dict]:
+        limit = _record_id({"id": before}) if before else None
+        index = self._indexed()
+        yield from index.iter_newest(limit)
+        # Below the oldest hot id: a crash mid-rotation can leave a record in both places
+        oldest = _record_id(index.records[0]) if index.records else None
+        if oldest is not None:
+            limit = oldest if limit is None else min(limit, oldest)
+        yield from self.archive.iter_newest(limit)
+
+    # -- retention --------------------------------------------------------
+
+    def rotate(self, now: Optional[datetime] = None) -> int:
+        current = _current_month(now)
+        records = self._indexed().records
+        oldest = next((m for m in map(month_of, records) if m), current)
+        if not records or oldest >= current:
+            return 0                                   # common case: nothing closed yet
+        # The hot file is about to be rewritten, so queued appends must land first
+        flush_writes()
+        with self._lock:
+            if self._unflushed:
+                return 0                               # appends raced in; next run picks it up
+            records = self._indexed().records
+            months = _segment_months(records, current)
+            closed = 0
+            while closed < len(records) and months[closed] < current:
+                closed += 1
+            if not closed:
+                return 0
+            self.archive.add(records[:closed], months[:closed])
+            keep = records[closed:]
+            _write_atomic(self.path, "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in keep))
+            self._index = LogIndex(keep)
+            self._signature = self._stat()
+            self._changed()
+        logging.info(f"Archived {closed} log entries from before {current}")
+        return closed
+
+    def compact(self, retention_months: int = 0, now: Optional[datetime] = None) -> Dict:
+        archived = self.rotate(now)
+        expired = self.archive.expire(retention_months, now)
+        self.archive.rebuild_manifest()
+        return dict(self.storage_stats(), archived_now=archived, expired=expired)
+
+    def storage_stats(self) -> Dict:
+        return dict(self.archive.stats(), hot=len(self._indexed().records))
+
+    def version(self) -> Tuple[int, float]:
+        self._indexed()                              # notices another writer's appends
+        archive = self.archive.signature()           # ...and compactions of the archive
+        with self._lock:
+            if archive != self._archive_signature:
+                if self._archive_signature is not None:
+                    self._changed()
+                self._archive_signature = archive
+            return self._changes, self._changed_at
+
+
+def _sqlite_store(**kwargs) -> LogStore:
+    from sqlite_store import SqliteLogStore     # imports this module
+    return SqliteLogStore(**kwargs)
+
+
+ENGINES = {
+    "jsonl": JsonlLogStore,
+    "sqlite": _sqlite_store,
+}
+
+
+def open_store(engine: str = "jsonl", **kwargs) -> LogStore:
+    """Build the storage engine named in config.json ('log_store')."""
+    try:
+        cls = ENGINES[engine]
+    except KeyError:
+        raise ValueError(f"Unknown log store engine: {engine}")
+    return cls(**kwargs)
+
+
+def main(argv=None) -> None:
+    """Maintenance CLI: python log_store.py compact | rebuild-manifest"""
+    parser = argparse.ArgumentParser(description="Moderation log maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compact = commands.add_parser("compact", help="archive closed months, apply retention, rebuild the manifest")
+    compact.add_argument("--retention-months", type=int, default=None,
+                         help="delete archives older than this (default: log_retention_months from config.json)")
+    commands.add_parser("rebuild-manifest", help="recompute the archive manifest from the segment files")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    store = JsonlLogStore()
+    if args.command == "compact":
+        retention = args.retention_months
+        if retention is None:
+            from config_service import get_config
+            retention = get_config().get("log_retention_months", 0)
+        print(json.dumps(store.compact(retention), indent=4))
+    else:
+        print(f"{store.archive.rebuild_manifest()} segments indexed")
+
+
+if __name__ == "__main__":
+    main()
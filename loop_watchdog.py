@@ -0,0 +1,163 @@
+# loop_watchdog.py
+"""
+Event-loop stall detection.
+
+A heartbeat coroutine on the bot loop measures how late its sleeps wake up;
+a watchdog thread notices when the heartbeat is overdue and captures the
+loop thread's stack while the stall is still happening, so the report shows
+the line that is blocking rather than whatever ran afterwards. Stalls inside
+dynamic command scripts are attributed to the command and flagged.
+
+Scripts can move blocking work off the loop with ``await run_blocking(fn, ...)``.
+"""
+import asyncio
+import functools
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional
+
+import metrics
+
+SCRIPT_PREFIX = "<command "          # filename script_cache gives compiled scripts
+STACK_LIMIT = 25
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25, max_events: int = 50):
+        self.interval = interval
+        self.threshold = max(threshold, interval * 2)
+        self.events: "deque[Dict]" = deque(maxlen=max_events)
+        self.flagged: Dict[str, int] = {}     # command -> stalls attributed to it
+        self.stall_count = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._running: Dict[asyncio.Task, str] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._beat = time.monotonic()
+        self._capture: Optional[Dict] = None
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Call from the loop to watch (e.g. setup_hook)."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = self._loop.create_task(self._heartbeat(), name="loop-watchdog")
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    @contextmanager
+    def running(self, name: str):
+        """Attribute stalls in the current task to *name* while the block runs."""
+        task = asyncio.current_task()
+        self._running[task] = name
+        try:
+            yield
+        finally:
+            self._running.pop(task, None)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - started - self.interval)
+            self._beat = now
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            metrics.LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                self._record(lag)
+
+    def _watch(self) -> None:
+        # Runs in its own thread: it keeps ticking while the loop is stuck
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            if self._capture is None and time.monotonic() - beat >= self.threshold:
+                self._capture = self._snapshot(beat)
+
+    def _snapshot(self, beat: float) -> Dict:
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = traceback.extract_stack(frame, limit=STACK_LIMIT) if frame is not None else []
+        command = where = None
+        for entry in reversed(stack):
+            if entry.filename.startswith(SCRIPT_PREFIX):
+                command = entry.filename[len(SCRIPT_PREFIX):-1]
+                where = f"/{command} script line {entry.lineno - 1}"     # the wrapper adds one line
+                break
+        task = asyncio.current_task(self._loop) if self._loop else None
+        if command is None and task is not None:
+            command = self._running.get(task)
+        if where is None and stack:
+            where = f"{stack[-1].filename}:{stack[-1].lineno} in {stack[-1].name}"
+        return {
+            "beat": beat,
+            "command": command,
+            "task": task.get_name() if task is not None else None,
+            "where": where,
+            "stack": "".join(traceback.format_list(stack)),
+        }
+
+    def _record(self, lag: float) -> None:
+        capture, self._capture = self._capture, None
+        if capture is None:
+            capture = {"command": None, "task": None, "where": None, "stack": ""}
+        capture.pop("beat", None)
+        event = dict(capture, duration=round(lag, 3), at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        self.events.appendleft(event)
+        self.stall_count += 1
+        command = event["command"]
+        if command:
+            self.flagged[command] = self.flagged.get(command, 0) + 1
+        metrics.LOOP_STALLS.inc(command=command or "")
+
+    def stats(self) -> Dict:
+        return {
+            "threshold": self.threshold,
+            "last_lag": round(self.last_lag, 4),
+            "max_lag": round(self.max_lag, 4),
+            "stalls": self.stall_count,
+            "flagged": dict(sorted(self.flagged.items(), key=lambda kv: -kv[1])),
+            "events": list(self.events),
+        }
+
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+_pool_workers = 4
+
+
+def configure_pool(workers: int) -> None:
+    """Size of the pool behind run_blocking(); 0 runs the call inline."""
+    global _pool_workers
+    _pool_workers = max(0, int(workers))
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=_pool_workers, thread_name_prefix="script")
+        return _pool
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking call (file I/O, requests, heavy loops) in the script thread pool."""
+    if _pool_workers == 0:
+        return fn(*args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_get_pool(), functools.partial(fn, *args, **kwargs))
@@ -0,0 +1,233 @@
+# metrics.py
+"""
+In-process metrics, exported in the Prometheus text format at /metrics.
+
+Small on purpose: labelled counters and histograms, thread-safe, no
+dependencies. The metric objects the bot records into are defined at the
+bottom of this module.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return lines + self._samples()
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """The exposition lines for this metric's values."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in items]
+
+
+class Gauge(Counter):
+    """A labelled value that goes up and down (queue depths, in-flight calls)."""
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, list] = {}       # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series[-1] if series else 0
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, hits in zip(self.buckets, series):
+                cumulative += hits
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def track(histogram: Histogram, errors: Counter, **labels):
+    """Time the block into *histogram*; an exception also counts into *errors*."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        errors.inc(**labels)
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+def timed_task(name: str):
+    """
+    Decorator for the async moderation tasks. Besides exceptions, a result of
+    (False, message) – how the appeal helpers report failure – counts as an error.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with track(TASK_SECONDS, TASK_ERRORS, task=name):
+                result = await fn(*args, **kwargs)
+            if isinstance(result, tuple) and result and result[0] is False:
+                TASK_ERRORS.inc(task=name)
+            return result
+        return wrapper
+    return decorator
+
+
+# -- what the bot records ---------------------------------------------------
+
+ROUTE_SECONDS = Histogram("modbot_http_request_duration_seconds",
+                          "Dashboard request latency by route.", ("route", "method"))
+ROUTE_ERRORS = Counter("modbot_http_request_errors_total",
+                       "Dashboard requests that raised or returned a 5xx.", ("route", "method"))
+
+COMMAND_SECONDS = Histogram("modbot_command_duration_seconds",
+                            "Run time of dynamic slash commands.", ("command",))
+COMMAND_ERRORS = Counter("modbot_command_errors_total",
+                         "Dynamic slash commands that raised.", ("command",))
+
+TASK_SECONDS = Histogram("modbot_task_duration_seconds",
+                         "Run time of appeal tasks (accept, deny, open_case).", ("task",))
+TASK_ERRORS = Counter("modbot_task_errors_total",
+                      "Appeal tasks that raised or reported failure.", ("task",))
+
+LOOP_SCHEDULE_SECONDS = Histogram("modbot_loop_schedule_delay_seconds",
+                                  "Time a coroutine handed over from the dashboard thread waited "
+                                  "before the bot loop started it.", ("call",))
+LOOP_WAIT_SECONDS = Histogram("modbot_loop_wait_seconds",
+                              "Time a dashboard thread blocked on run_coroutine_threadsafe(...).result().",
+                              ("call",))
+LOOP_TIMEOUTS = Counter("modbot_loop_wait_timeouts_total",
+                        "Cross-thread calls that gave up waiting on the bot loop.", ("call",))
+
+DISCORD_REQUESTS = Counter("modbot_discord_requests_total",
+                           "Discord HTTP API calls by route (fetch_user is GET /users/{user_id}).",
+                           ("method", "route", "status"))
+DISCORD_SECONDS = Histogram("modbot_discord_request_duration_seconds",
+                            "Discord HTTP API call latency, including rate-limit waits.", ("method", "route"))
+
+FETCHES = Counter("modbot_fetch_total",
+                  "Single-flight lookups (fetch_user, fetch_channel, script generation): served from "
+                  "the short cache, merged into an in-flight call, or actually run.", ("kind", "outcome"))
+
+DISCORD_QUEUE_DEPTH = Gauge("modbot_discord_queue_depth",
+                            "Discord API calls waiting for a slot, by priority class.", ("priority",))
+DISCORD_IN_FLIGHT = Gauge("modbot_discord_in_flight",
+                          "Discord API calls holding a slot, by priority class.", ("priority",))
+DISCORD_QUEUE_SECONDS = Histogram("modbot_discord_queue_wait_seconds",
+                                  "Time a Discord API call waited for a slot in its priority class.",
+                                  ("priority",))
+
+MODERATION_EVENTS = Counter("modbot_moderation_events_total",
+                            "Gateway and audit-log moderation events: received, merged with the other "
+                            "source's copy, skipped as logged by the bot itself (own), or written.",
+                            ("source", "outcome"))
+
+LOOP_LAG = Histogram("modbot_event_loop_lag_seconds",
+                     "How late the bot loop's watchdog heartbeat woke up.")
+LOOP_STALLS = Counter("modbot_event_loop_stalls_total",
+                      "Heartbeats late by more than loop_stall_threshold, by the dynamic command blamed.",
+                      ("command",))
@@ -1,16 +1,31 @@
 import discord
 from discord import app_commands
+import asyncio
 from datetime import datetime
-from typing import Optional
-from log_helper import add_log
-import json
-import os
+from typing import Dict, List, Optional, Tuple
+import logging
+from log_helper import add_log, add_logs, get_log, mark_logged, unmark_logged
+from config_service import get_config
+from appeal_store import get_store as get_appeal_store
+from metrics import timed_task
+from request_scheduler import request_priority, MODERATION, BACKGROUND
 
-async def perform_accept_action(bot, guild, user_id: str, action: str, reason: str):
+# Most appeals handled by one bulk request, and how many Discord calls it runs at once by default
+BULK_LIMIT = 200
+DEFAULT_BULK_CONCURRENCY = 5
+
+async def undo_action(bot, guild, user_id: str, action: str, reason: str) -> Dict:
+    """Reverse *action* on Discord and return the log entry describing it (not yet stored)."""
     uid = int(user_id)
     if action == 'unban':
-        user = await bot.fetch_user(uid)
-        await guild.unban(user, reason=reason)
+        # unban only needs the id; fetching the user first would be a second, queueable call
+        mark_logged("unban", uid)              # our caller logs it; the gateway event is a duplicate
+        try:
+            with request_priority(MODERATION):
+                await guild.unban(discord.Object(id=uid), reason=reason)
+        except Exception:
+            unmark_logged("unban", uid)        # not ours after all: an unban from elsewhere must be logged
+            raise
         log_type = "unban"
     elif action == 'unkick':
         # Overturn kick (record-only)
@@ -18,12 +33,16 @@ async def perform_accept_action(bot, guild, user_id: str, action: str, reason: s
     else:
         raise ValueError(f"Unknown action: {action}")
 
-    add_log({
+    return {
         "type": log_type,
         "user_id": str(uid),
         "reason": reason,
         "timestamp": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    })
+    }
+
+async def perform_accept_action(bot, guild, user_id: str, action: str, reason: str):
+    entry = await undo_action(bot, guild, user_id, action, reason)
+    await asyncio.to_thread(add_log, entry)
 
 @app_commands.command(name="accept", description="Accept an appeal and undo an action on the main server")
 @app_commands.describe(user_id="The ID of the user to act upon", reason="Optional reason for the action")
@@ -45,15 +64,12 @@ async def accept_command(interaction: discord.Interaction, user_id: str, reason:
 
         async def callback(self, select_interaction: discord.Interaction):
             try:
-                cfg_path = os.path.join(os.getcwd(), 'config.json')
-                with open(cfg_path, 'r', encoding='utf-8') as f:
-                    cfg = json.load(f)
-                main_server_id = cfg.get('main_server')
+                main_server_id = get_config().main_server
                 if not main_server_id:
                     await select_interaction.response.send_message("Main server not configured.", ephemeral=True)
                     return
 
-                guild = self.bot.get_guild(int(main_server_id))
+                guild = self.bot.get_guild(main_server_id)
                 if not guild:
                     await select_interaction.response.send_message("Bot is not in the main server.", ephemeral=True)
                     return
@@ -74,16 +90,243 @@ async def accept_command(interaction: discord.Interaction, user_id: str, reason:
     view = ActionView(user_id, reason, interaction.client)
     await interaction.response.send_message(f"Choose action to perform on <@{user_id}>:", view=view, ephemeral=True)
 
-async def notify_user_of_appeal(bot, user_id: str, invite_link: str):
+async def notify_user_of_appeal(bot, user_id: str, invite_link: str, user=None):
     try:
-        user = await bot.fetch_user(int(user_id))
-        embed = discord.Embed(
-            title="Appeal Case Opened",
-            description=f"Your appeal case has been opened. To proceed, please join our dedicated appeal server using the link below.\n\n**Invite Link:** {invite_link}",
-            color=discord.Color.blue()
-        )
-        embed.add_field(name="Instructions", value="Once you join the server, you will be automatically added to your private appeal thread. Please wait for a moderator to contact you there.")
-        await user.send(embed=embed)
+        # A courtesy DM: it must not hold up unbans queued behind it
+        with request_priority(BACKGROUND):
+            if user is None:
+                user = await bot.fetch_user(int(user_id))
+            embed = discord.Embed(
+                title="Appeal Case Opened",
+                description=f"Your appeal case has been opened. To proceed, please join our dedicated appeal server using the link below.\n\n**Invite Link:** {invite_link}",
+                color=discord.Color.blue()
+            )
+            embed.add_field(name="Instructions", value="Once you join the server, you will be automatically added to your private appeal thread. Please wait for a moderator to contact you there.")
+            await user.send(embed=embed)
     except Exception as e:
-        import logging
         logging.error(f"Failed to send DM to user {user_id}: {e}")
+
+# --- Appeal workflow (shared by both dashboard front-ends) ---
+
+def submit_appeal(log_id: str, appeal_text: str) -> Optional[Dict]:
+    """
+    File an appeal against a log entry. Returns None if the log doesn't exist.
+    Resubmitting replaces the text and timestamp; an open case (thread_id) is kept.
+    """
+    log_entry = get_log(log_id)
+    if not log_entry:
+        return None
+
+    return get_appeal_store().upsert({
+        "log_id": log_id,
+        "user_id": log_entry.get('user_id'),
+        "text": appeal_text,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+
+@timed_task("accept")
+async def accept_appeal(bot, user_id: str, log_id: str, action: str, reason: str) -> Tuple[bool, str]:
+    try:
+        main_server_id = get_config().main_server
+        if not main_server_id:
+            return False, "Main server ID not configured."
+        guild = bot.get_guild(main_server_id)
+        if not guild:
+            return False, "Bot not in main server."
+        await perform_accept_action(bot, guild, user_id, action, reason)
+
+        # Dismiss appeal (off the loop: the sqlite store can wait on a write lock)
+        await asyncio.to_thread(get_appeal_store().delete, user_id, log_id)
+
+        return True, "Appeal accepted and action performed."
+    except Exception as e:
+        return False, f"Error: {e}"
+
+@timed_task("deny")
+async def deny_appeal(bot, user_id: str, log_id: str, reason: str) -> Tuple[bool, str]:
+    try:
+        appeal = get_appeal_store().get(user_id, log_id)
+
+        if appeal and appeal.get('thread_id'):
+            try:
+                thread = await bot.fetch_channel(int(appeal.get('thread_id')))
+                await thread.send(f"This appeal has been denied. Reason: {reason}")
+            except Exception as e:
+                logging.error(f"Failed to send denial to thread: {e}")
+
+        # Dismiss appeal
+        await asyncio.to_thread(get_appeal_store().delete, user_id, log_id)
+
+        return True, "Appeal denied and thread notified."
+    except Exception as e:
+        return False, f"Error: {e}"
+
+@timed_task("bulk")
+async def process_appeals(bot, appeals: List[Dict], decision: str, action: str = 'unban',
+                          reason: Optional[str] = None, concurrency: Optional[int] = None) -> List[Dict]:
+    """
+    Accept or deny many appeals at once.
+    Discord calls run concurrently (at most *concurrency* at a time); the
+    resulting log entries are stored in one batch and the handled appeals are
+    removed with a single save. Returns one {user_id, log_id, status, message}
+    per input appeal, in order.
+    """
+    if decision not in ('accept', 'deny'):
+        raise ValueError(f"Unknown decision: {decision}")
+    if concurrency is None:
+        concurrency = get_config().get('bulk_concurrency', DEFAULT_BULK_CONCURRENCY)
+    reason = reason or ("Appeal accepted" if decision == 'accept' else "No reason given")
+    store = get_appeal_store()
+
+    guild = None
+    if decision == 'accept':
+        main_server_id = get_config().main_server
+        guild = bot.get_guild(main_server_id) if main_server_id else None
+        if guild is None:
+            message = "Main server ID not configured." if not main_server_id else "Bot not in main server."
+            return [dict(_ids(a), status="error", message=message) for a in appeals]
+
+    semaphore = asyncio.Semaphore(max(1, int(concurrency)))
+
+    async def _one(item) -> Tuple[Dict, Optional[Dict]]:
+        ids = _ids(item)
+        appeal = store.get(ids['user_id'], ids['log_id'])
+        if appeal is None:
+            return dict(ids, status="error", message="Appeal not found"), None
+        async with semaphore:
+            try:
+                if decision == 'accept':
+                    entry = await undo_action(bot, guild, ids['user_id'], action, reason)
+                    return dict(ids, status="success", message=f"{entry['type']} done"), entry
+                if appeal.get('thread_id'):
+                    try:
+                        thread = await bot.fetch_channel(int(appeal['thread_id']))
+                        await thread.send(f"This appeal has been denied. Reason: {reason}")
+                    except Exception as e:
+                        logging.error(f"Failed to send denial to thread: {e}")
+                return dict(ids, status="success", message="Appeal denied"), None
+            except Exception as e:
+                return dict(ids, status="error", message=f"Error: {e}"), None
+
+    async def _duplicate(item):
+        return dict(_ids(item), status="error", message="Duplicate in request"), None
+
+    seen = set()
+    jobs = []
+    for item in appeals:
+        key = tuple(_ids(item).values())
+        jobs.append(_duplicate(item) if key in seen else _one(item))
+        seen.add(key)
+    outcomes = await asyncio.gather(*jobs)
+    report = [result for result, _ in outcomes]
+    entries = [entry for _, entry in outcomes if entry is not None]
+    if entries:
+        await asyncio.to_thread(add_logs, entries)
+    done = [(r['user_id'], r['log_id']) for r in report if r['status'] == 'success']
+    if done:
+        await asyncio.to_thread(store.delete_many, done)
+    return report
+
+def _ids(item: Dict) -> Dict:
+    return {"user_id": str(item.get('user_id', '')), "log_id": str(item.get('log_id', ''))}
+
+def bulk_request_error(payload) -> Optional[str]:
+    """Validate a /api/bulk_appeals body; returns an error message or None."""
+    if not isinstance(payload, dict):
+        return "Expected a JSON object"
+    if payload.get('decision') not in ('accept', 'deny'):
+        return "decision must be 'accept' or 'deny'"
+    if payload.get('decision') == 'accept' and payload.get('action', 'unban') not in ('unban', 'unkick'):
+        return "action must be 'unban' or 'unkick'"
+    appeals = payload.get('appeals')
+    if not isinstance(appeals, list) or not appeals:
+        return "appeals must be a non-empty list"
+    if len(appeals) > BULK_LIMIT:
+        return f"At most {BULK_LIMIT} appeals per request"
+    if not all(isinstance(a, dict) and a.get('user_id') and a.get('log_id') for a in appeals):
+        return "Every appeal needs user_id and log_id"
+    return None
+
+@timed_task("open_case")
+async def open_appeal_case(bot, user_id: str, log_id: str, progress=None) -> str:
+    """
+    Create the private appeal thread, add the user and DM them the invite. Returns a status message.
+    Steps that don't depend on each other run concurrently; *progress(step, status, detail)*
+    is called as each one starts and finishes (a jobs.Job's step method fits).
+    """
+    report = progress or (lambda step, status="running", detail="": None)
+    config = get_config()
+    channel_id = config.app_channel_id
+    if not channel_id:
+        return "App channel ID not configured in config.json."
+
+    async def _channel():
+        report("channel")
+        channel = bot.get_channel(channel_id)
+        if not channel:
+            # Try fetching if not in cache
+            channel = await bot.fetch_channel(channel_id)
+        report("channel", "done")
+        return channel
+
+    async def _user():
+        report("user")
+        user = await bot.fetch_user(int(user_id))
+        report("user", "done", str(user))
+        return user
+
+    # The user lookup doesn't need the channel, so both go out at once
+    channel, user = await asyncio.gather(_channel(), _user(), return_exceptions=True)
+    if isinstance(channel, BaseException):
+        report("channel", "error", str(channel))
+        return "Could not find configured log channel."
+    if isinstance(user, BaseException):
+        report("user", "error", str(user))
+
+    try:
+        # Send initial message and create the thread
+        report("thread")
+        msg_content = f"Appeal Case - <@{user_id}> [Log ID: {log_id}]"
+        message = await channel.send(msg_content)
+        thread = await message.create_thread(name=f"appeal-{user_id}", auto_archive_duration=1440)
+
+        # Store thread_id in appeal entry
+        await asyncio.to_thread(get_appeal_store().update, user_id, log_id, thread_id=str(thread.id))
+        report("thread", "done", thread.name)
+    except Exception as e:
+        report("thread", "error", str(e))
+        return f"Bot Error: {e}"
+
+    async def _add_user() -> str:
+        # May fail if user is banned and not in the server
+        report("add_user")
+        try:
+            if isinstance(user, BaseException):
+                raise user
+            with request_priority(BACKGROUND):
+                await thread.add_user(user)
+            report("add_user", "done")
+            return "Thread created and user added."
+        except discord.Forbidden:
+            report("add_user", "error", "Forbidden")
+            await thread.send("Created thread, but could not add user (Permissions error or user banned).")
+            return "Thread created (User add failed: Forbidden)."
+        except Exception as e:
+            report("add_user", "error", str(e))
+            await thread.send(f"Created thread, but error adding user: {e}")
+            return f"Thread created (User add failed: {e})."
+
+    async def _notify() -> str:
+        report("dm")
+        if isinstance(user, BaseException):
+            report("dm", "error", "user not found")
+            return ""
+        await notify_user_of_appeal(bot, user_id, config.application_invite_link, user=user)
+        report("dm", "done")
+        return " User notified via DM."
+
+    try:
+        thread_result, notified = await asyncio.gather(_add_user(), _notify())
+    except Exception as e:
+        return f"Bot Error: {e}"
+    return thread_result + notified
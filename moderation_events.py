@@ -0,0 +1,216 @@
+# moderation_events.py
+"""
+Moderation actions taken outside the bot – bans, unbans, kicks and timeouts
+done from Discord's own UI – recorded in the moderation log.
+
+Two event sources feed one bounded queue:
+
+    on_audit_log_entry_create   ban / unban / kick / timeout, with moderator
+                                and reason (needs View Audit Log)
+    on_member_ban / _unban      fallback without either
+
+A single consumer drains the queue in batches: it waits up to *window*
+seconds for more events, merges the two sources' copies of the same action
+(the audit-log one wins), drops actions the bot logged itself (see
+log_helper.mark_logged) and stores the rest with one add_logs call. A raid
+of hundreds of bans is a handful of appends. When the queue is full the
+event handlers wait, which slows intake instead of losing entries.
+
+A gateway event that arrived late in a batch is carried into the next one,
+so it always gets a full window for its audit-log copy. What was written is
+remembered for *dedupe_window* seconds: a later audit-log copy is still
+written (it has the moderator and reason), a later gateway copy is not.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import discord
+
+import metrics
+from log_helper import add_logs, logged_recently
+
+AUDIT, GATEWAY = "audit_log", "gateway"
+_STOP = object()                                # queued by stop(): write what's left and exit
+
+
+def _timestamp(when: Optional[datetime] = None) -> str:
+    # Same format (UTC) the ban/kick scripts log with
+    return (when or datetime.now(timezone.utc)).astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def audit_entry_log(entry: discord.AuditLogEntry) -> Optional[Dict]:
+    """The log entry for a moderation audit-log entry, or None for anything else."""
+    action = entry.action
+    if action == discord.AuditLogAction.ban:
+        log_type = "ban"
+    elif action == discord.AuditLogAction.unban:
+        log_type = "unban"
+    elif action == discord.AuditLogAction.kick:
+        log_type = "kick"
+    elif action == discord.AuditLogAction.member_update:
+        before = getattr(entry.before, "timed_out_until", None)
+        after = getattr(entry.after, "timed_out_until", None)
+        if after == before:
+            return None                         # a nickname or role change
+        log_type = "timeout" if after else "untimeout"
+    else:
+        return None
+    target_id = getattr(entry.target, "id", None)
+    if target_id is None:
+        return None
+    log = {
+        "type": log_type,
+        "user_id": str(target_id),
+        "reason": entry.reason or "No reason given",
+        "timestamp": _timestamp(entry.created_at),
+        "moderator_id": str(entry.user_id) if entry.user_id else None,
+        "source": AUDIT,
+    }
+    if log_type == "timeout":
+        log["until"] = _timestamp(getattr(entry.after, "timed_out_until"))
+    return log
+
+
+class ModerationEventIngest:
+    def __init__(self, guild_id: Optional[int] = None, window: float = 2.0, max_queue: int = 1000,
+                 max_batch: int = 500, dedupe_window: float = 30.0):
+        self.guild_id = guild_id                # only this guild (the main server); None: every guild
+        self.window = window
+        self.max_batch = max_batch
+        self.dedupe_window = dedupe_window
+        # (arrival time, log entry)
+        self.queue: "asyncio.Queue[Tuple[float, Dict]]" = asyncio.Queue(maxsize=max(1, max_queue))
+        self._task: Optional[asyncio.Task] = None
+        self._written: Dict[Tuple[str, str], Tuple[str, float]] = {}     # (type, user_id) -> (source, when)
+        self.received = 0
+        self.written = 0
+        self.merged = 0
+        self.own = 0                            # already logged by the bot
+        self.batches = 0
+        self.full_waits = 0
+
+    # -- producers (event handlers) ---------------------------------------
+
+    def _wanted(self, guild) -> bool:
+        return self.guild_id is None or guild is None or guild.id == self.guild_id
+
+    async def audit_entry(self, entry: discord.AuditLogEntry) -> None:
+        if not self._wanted(entry.guild):
+            return
+        log = audit_entry_log(entry)
+        if log is not None:
+            await self._put(log)
+
+    async def member_event(self, log_type: str, guild, user) -> None:
+        if not self._wanted(guild):
+            return
+        await self._put({"type": log_type, "user_id": str(user.id), "reason": "No reason given",
+                         "timestamp": _timestamp(), "source": GATEWAY})
+
+    async def _put(self, log: Dict) -> None:
+        if self._task is None:
+            return                              # not started (ingest_moderation_events off) or stopped
+        self.received += 1
+        metrics.MODERATION_EVENTS.inc(source=log["source"], outcome="received")
+        if self.queue.full():
+            self.full_waits += 1
+        await self.queue.put((time.monotonic(), log))
+
+    # -- consumer ---------------------------------------------------------
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="moderation-events")
+
+    async def stop(self) -> None:
+        """Write whatever is queued, then stop the consumer."""
+        task, self._task = self._task, None      # new events are ignored from here on
+        if task is None:
+            return
+        await self.queue.put(_STOP)
+        await task
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        held: List[Tuple[float, Dict]] = []      # gateway events still waiting for their audit-log copy
+        stopping = False
+        while not stopping:
+            batch, held = held, []
+            if not batch:
+                item = await self.queue.get()
+                if item is _STOP:
+                    break
+                batch = [item]
+            # Let the other source's copy (and the rest of a raid) arrive before writing
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            if not batch:
+                continue
+            try:
+                held = await self._flush(batch, final=stopping)
+            except Exception as e:
+                held = []
+                logging.error(f"Failed to store {len(batch)} moderation events: {e}")
+
+    async def _flush(self, batch: List[Tuple[float, Dict]], final: bool = False) -> List[Tuple[float, Dict]]:
+        """Write *batch*; returns the gateway events held back for the next one."""
+        entries: Dict[Tuple[str, str], Tuple[float, Dict]] = {}
+        for arrived, log in batch:
+            key = (log["type"], log["user_id"])
+            if key in entries:
+                self.merged += 1
+                metrics.MODERATION_EVENTS.inc(source=log["source"], outcome="merged")
+                if entries[key][1]["source"] == AUDIT:
+                    continue                      # keep the one with moderator and reason
+            entries[key] = (arrived, log)
+
+        now = time.monotonic()
+        self._written = {k: v for k, v in self._written.items() if now - v[1] <= self.dedupe_window}
+        fresh, held = [], []
+        for key, (arrived, log) in entries.items():
+            if log["source"] == GATEWAY and not final and now - arrived < self.window:
+                held.append((arrived, log))
+            # Checked now rather than on arrival: a script logs right after its own ban call
+            elif logged_recently(*key, self.dedupe_window):
+                self.own += 1
+                metrics.MODERATION_EVENTS.inc(source=log["source"], outcome="own")
+            elif key in self._written and (log["source"] == GATEWAY or self._written[key][0] == AUDIT):
+                self.merged += 1                  # its other copy went out in an earlier batch
+                metrics.MODERATION_EVENTS.inc(source=log["source"], outcome="merged")
+            else:
+                fresh.append(log)
+        if fresh:
+            # Not marked as the bot's own: that would swallow the audit-log copy of a gateway event
+            await asyncio.to_thread(add_logs, fresh, False)
+            self.written += len(fresh)
+            for log in fresh:
+                self._written[(log["type"], log["user_id"])] = (log["source"], now)
+                metrics.MODERATION_EVENTS.inc(source=log["source"], outcome="written")
+        self.batches += 1
+        return held
+
+    def stats(self) -> Dict:
+        return {
+            "queued": self.queue.qsize(),
+            "max_queue": self.queue.maxsize,
+            "received": self.received,
+            "written": self.written,
+            "merged": self.merged,
+            "own": self.own,
+            "batches": self.batches,
+            "full_waits": self.full_waits,
+        }
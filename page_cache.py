@@ -0,0 +1,146 @@
+# page_cache.py
+"""
+Rendered dashboard pages, cached per (route, query, logged in) and validated
+by the version counters of the stores the page reads (log_helper.log_version,
+AppealStore.version). A write bumps the counter, so the next request misses
+and re-renders; nothing has to be evicted by hand.
+
+The same versions drive ETag / Last-Modified, so an auto-refreshing tab gets
+a 304 without the page being rendered or even looked up.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Sequence, Tuple
+
+from appeal_store import get_store as get_appeal_store
+from log_helper import log_version
+
+# ETags must not survive a restart: the counters start from zero again
+_BOOT = uuid.uuid4().hex[:8]
+
+
+# What a page can depend on -> its current version
+SOURCES = {
+    "logs": log_version,
+    "appeals": lambda: get_appeal_store().version(),
+}
+
+
+class Page(NamedTuple):
+    body: bytes
+    content_type: str
+
+
+class Conditional(NamedTuple):
+    key: Tuple
+    version: Tuple
+    headers: Dict[str, str]     # validators to send with the page
+    not_modified: bool          # answer 304 instead
+
+
+class PageCache:
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._pages: "OrderedDict[Tuple, Tuple[Tuple, Page]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key: Tuple, version: Tuple) -> Optional[Page]:
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Tuple, version: Tuple, page: Page) -> None:
+        with self._lock:
+            self._pages[key] = (version, page)
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def capture(self, chunks: Iterable, key: Tuple, version: Tuple, content_type: str) -> Iterator[bytes]:
+        """Pass a streamed body through, caching it once it has been sent completely."""
+        parts = []
+        chunks = iter(chunks)
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                parts.append(chunk)
+                yield chunk
+        finally:
+            close = getattr(chunks, "close", None)     # the client went away: let the source clean up
+            if close is not None:
+                close()
+        self.put(key, version, Page(b"".join(parts), content_type))
+
+    def note_not_modified(self) -> None:
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pages": len(self._pages), "hits": self.hits, "misses": self.misses,
+                    "not_modified": self.not_modified}
+
+
+def page_version(*versions) -> Optional[Tuple]:
+    """Combine store versions; None (uncacheable) if any store can't report one."""
+    if any(v is None for v in versions):
+        return None
+    return tuple(versions)
+
+
+def validators(key: Tuple, version: Tuple) -> Tuple[str, Optional[str]]:
+    """
+    (ETag, Last-Modified) for a page at *version*. Last-Modified has whole
+    seconds, so it is left out while the second of the last change is still
+    running – another write in that second would be indistinguishable.
+    """
+    digest = hashlib.sha1(repr((key, version)).encode("utf-8")).hexdigest()[:20]
+    last_change = int(max(changed_at for _, changed_at in version))
+    last_modified = formatdate(last_change, usegmt=True) if int(time.time()) > last_change else None
+    return f'W/"{_BOOT}-{digest}"', last_modified
+
+
+def is_not_modified(if_none_match: Optional[str], if_modified_since: Optional[str],
+                    etag: str, last_modified: Optional[str]) -> bool:
+    """RFC 7232: If-None-Match wins; If-Modified-Since is only used without it."""
+    if if_none_match:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags or etag[2:] in tags
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def check(sources: Sequence[str], key: Tuple, if_none_match: Optional[str],
+          if_modified_since: Optional[str]) -> Optional[Conditional]:
+    """Validate a GET against the current versions of *sources*. None: don't cache this page."""
+    version = page_version(*(SOURCES[name]() for name in sources))
+    if version is None:
+        return None
+    etag, last_modified = validators(key, version)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    not_modified = is_not_modified(if_none_match, if_modified_since, etag, last_modified)
+    if not_modified:
+        page_cache.note_not_modified()
+    return Conditional(key, version, headers, not_modified)
+
+
+page_cache = PageCache()
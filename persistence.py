@@ -0,0 +1,226 @@
+# persistence.py
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+Callback = Optional[Callable[[], None]]
+
+
+def _fsync_dir(path: str) -> None:
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return                                 # e.g. Windows – directories can't be opened
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class PersistenceWorker:
+    """
+    Write-behind for the JSON state files.
+
+    Stores mark a document dirty (write_json / write_text) or queue lines
+    (append_lines) and return immediately. A background thread waits up to
+    *window* seconds to collect more changes, then writes each dirty file once:
+    documents compactly via temp file + atomic rename, appends as one write.
+    The snapshot callable runs in the worker thread at write time, so several
+    updates to the same document cost one serialization.
+
+    *window* is the durability window – how much can be lost on a hard crash.
+    window=0 writes synchronously in the caller (the old behaviour).
+    """
+
+    def __init__(self, window: float = 0.5, fsync: bool = False):
+        self.window = window
+        self.fsync = fsync
+        self._cond = threading.Condition()
+        self._docs: Dict[str, Tuple[Callable[[], str], Callback]] = {}
+        self._appends: Dict[str, Tuple[List[str], List[Callable[[], None]]]] = {}
+        self._calls: List[Callable[[], None]] = []
+        self._submitted = 0
+        self._completed = 0
+        self._flush_requested = False
+        self._thread: Optional[threading.Thread] = None
+        self.batches = 0
+        self.writes = 0
+
+    def configure(self, window: Optional[float] = None, fsync: Optional[bool] = None) -> None:
+        if window is not None:
+            self.window = window
+        if fsync is not None:
+            self.fsync = fsync
+
+    # -- producers --------------------------------------------------------
+
+    def write_json(self, path: str, snapshot: Callable[[], Any], on_written: Callback = None) -> None:
+        """Mark *path* dirty; *snapshot()* is serialized (compact) when the write happens."""
+        self.write_text(path, lambda: json.dumps(snapshot(), separators=(",", ":")), on_written)
+
+    def write_text(self, path: str, render: Callable[[], str], on_written: Callback = None) -> None:
+        """Replace *path* with *render()*; later calls for the same path supersede earlier ones."""
+        with self._cond:
+            previous = self._docs.get(path)
+            callbacks = _chain(previous[1] if previous else None, on_written)
+            self._docs[path] = (render, callbacks)
+            self._submit()
+
+    def append_lines(self, path: str, lines: List[str], on_written: Callback = None) -> None:
+        """Append *lines* (each ending in a newline) to *path*, grouped with other pending appends."""
+        with self._cond:
+            pending, callbacks = self._appends.setdefault(path, ([], []))
+            pending.extend(lines)
+            if on_written:
+                callbacks.append(on_written)
+            self._submit()
+
+    def run(self, write: Callable[[], None]) -> None:
+        """Run *write()* in the worker thread, after the files queued before it (e.g. a database write)."""
+        with self._cond:
+            self._calls.append(write)
+            self._submit()
+
+    def _submit(self) -> None:
+        self._submitted += 1
+        if self.window <= 0:
+            self._drain_locked_sync()
+            return
+        self._ensure_thread()
+        self._cond.notify_all()
+
+    # -- consumer ---------------------------------------------------------
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="persistence", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._completed == self._submitted:
+                    self._cond.wait()
+                # Group commit: give other changes a chance to join this batch
+                deadline = time.monotonic() + self.window
+                while not self._flush_requested:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._flush_requested = False
+                docs, appends, calls, target = self._take()
+            self._write(docs, appends, calls)
+            with self._cond:
+                self._completed = target
+                self._cond.notify_all()
+
+    def _take(self):
+        docs, self._docs = self._docs, {}
+        appends, self._appends = self._appends, {}
+        calls, self._calls = self._calls, []
+        return docs, appends, calls, self._submitted
+
+    def _drain_locked_sync(self) -> None:
+        docs, appends, calls, target = self._take()
+        self._write(docs, appends, calls)
+        self._completed = target
+
+    def _write(self, docs, appends, calls) -> None:
+        if not docs and not appends and not calls:
+            return
+        self.batches += 1
+        for path, (lines, callbacks) in appends.items():
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write("".join(lines))
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                self.writes += 1
+            except OSError as e:
+                logging.error(f"Error appending to {path}: {e}")
+            for callback in callbacks:
+                _safe_call(callback)
+        for path, (render, callback) in docs.items():
+            tmp = path + ".tmp"
+            try:
+                text = render()
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(text)
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                os.replace(tmp, path)
+                if self.fsync:
+                    _fsync_dir(path)
+                self.writes += 1
+            except Exception as e:
+                logging.error(f"Error saving {path}: {e}")
+            _safe_call(callback)
+        for write in calls:
+            try:
+                write()
+                self.writes += 1
+            except Exception as e:
+                logging.error(f"Queued write failed: {e}")
+
+    def flush(self, timeout: Optional[float] = 10.0) -> bool:
+        """Write everything queued so far and wait for it. Returns False on timeout."""
+        with self._cond:
+            target = self._submitted
+            if self._completed >= target:
+                return True
+            if self._thread is None or not self._thread.is_alive():
+                self._drain_locked_sync()
+                return True
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._completed >= target, timeout=timeout)
+
+    def stats(self) -> dict:
+        return {
+            "window": self.window,
+            "fsync": self.fsync,
+            "pending": self._submitted - self._completed,
+            "batches": self.batches,
+            "writes": self.writes,
+        }
+
+
+def _chain(first: Callback, second: Callback) -> Callback:
+    if first is None:
+        return second
+    if second is None:
+        return first
+
+    def both():
+        first()
+        second()
+    return both
+
+
+def _safe_call(callback: Callback) -> None:
+    if callback is None:
+        return
+    try:
+        callback()
+    except Exception as e:
+        logging.error(f"Persistence callback failed: {e}")
+
+
+_worker = PersistenceWorker()
+atexit.register(_worker.flush)
+
+
+def get_worker() -> PersistenceWorker:
+    return _worker
+
+
+def flush(timeout: Optional[float] = 10.0) -> bool:
+    """Shutdown hook: block until every queued write is on disk."""
+    return _worker.flush(timeout)
@@ -0,0 +1,140 @@
+# request_scheduler.py
+"""
+Priority classes for outbound Discord API calls.
+
+Every REST call the bot makes passes through DiscordBot's http.request
+wrapper, which first takes a slot in the caller's class:
+
+    moderation   unbans and other actions a moderator is waiting on
+    interactive  everything not marked otherwise (commands, dashboard actions)
+    background   username lookups, appeal DMs, thread joins
+
+Each class has its own concurrency limit (config ``request_concurrency``).
+A class doesn't start calls while a more important class has calls queued,
+and background calls also hold back while any moderation call is in flight,
+so bulk unbans don't share the rate limits with /logs name lookups.
+
+Code marks its calls with ``with request_priority(BACKGROUND):``; the class
+is a context variable, so tasks created inside inherit it. Interaction
+responses don't go through http.request and are never queued.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+import metrics
+
+MODERATION, INTERACTIVE, BACKGROUND = "moderation", "interactive", "background"
+PRIORITIES = (MODERATION, INTERACTIVE, BACKGROUND)      # most important first
+DEFAULT_LIMITS = {MODERATION: 4, INTERACTIVE: 4, BACKGROUND: 2}
+
+_priority: ContextVar[str] = ContextVar("request_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def request_priority(name: str):
+    """Run the Discord calls made in this block (and tasks started in it) in class *name*."""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+class RequestScheduler:
+    """Per-class slots for Discord API calls. Runs on the bot loop only."""
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None):
+        self.limits = dict(DEFAULT_LIMITS)
+        for name, limit in (limits or {}).items():
+            if name in self.limits:
+                self.limits[name] = max(1, int(limit))
+        self._active = {name: 0 for name in PRIORITIES}
+        self._queues: Dict[str, "deque[asyncio.Future]"] = {name: deque() for name in PRIORITIES}
+        self._served = {name: 0 for name in PRIORITIES}
+        self._waited = {name: 0.0 for name in PRIORITIES}
+        self._max_wait = {name: 0.0 for name in PRIORITIES}
+
+    def _held_back(self, name: str) -> bool:
+        if self._active[name] >= self.limits[name]:
+            return True
+        if any(self._queues[higher] for higher in PRIORITIES[:PRIORITIES.index(name)]):
+            return True
+        return name == BACKGROUND and self._active[MODERATION] > 0
+
+    @asynccontextmanager
+    async def slot(self, name: Optional[str] = None):
+        """Hold a slot in class *name* (default: the caller's request_priority) for the block."""
+        name = name or current_priority()
+        if name not in self.limits:
+            name = INTERACTIVE
+        queued = time.monotonic()
+        if self._queues[name] or self._held_back(name):
+            waiter = asyncio.get_running_loop().create_future()
+            self._queues[name].append(waiter)
+            self._gauge(name)
+            try:
+                await waiter                       # _grant() has already counted us as active
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release(name)            # granted and cancelled in the same tick
+                else:
+                    if waiter in self._queues[name]:
+                        self._queues[name].remove(waiter)
+                    self._grant()                  # an emptied queue can unblock lower classes
+                    self._gauge(name)
+                raise
+        else:
+            self._active[name] += 1
+            self._gauge(name)
+        self._record_wait(name, time.monotonic() - queued)
+        try:
+            yield
+        finally:
+            self._release(name)
+
+    def _release(self, name: str) -> None:
+        self._active[name] -= 1
+        self._grant()
+        self._gauge(name)
+
+    def _grant(self) -> None:
+        for name in PRIORITIES:
+            queue = self._queues[name]
+            while queue and not self._held_back(name):
+                waiter = queue.popleft()
+                if waiter.done():
+                    continue                       # cancelled, its task hasn't cleaned up yet
+                self._active[name] += 1
+                waiter.set_result(None)
+            self._gauge(name)
+
+    def _record_wait(self, name: str, waited: float) -> None:
+        self._served[name] += 1
+        self._waited[name] += waited
+        self._max_wait[name] = max(self._max_wait[name], waited)
+        metrics.DISCORD_QUEUE_SECONDS.observe(waited, priority=name)
+
+    def _gauge(self, name: str) -> None:
+        metrics.DISCORD_QUEUE_DEPTH.set(len(self._queues[name]), priority=name)
+        metrics.DISCORD_IN_FLIGHT.set(self._active[name], priority=name)
+
+    def stats(self) -> Dict[str, Dict]:
+        return {
+            name: {
+                "limit": self.limits[name],
+                "active": self._active[name],
+                "queued": len(self._queues[name]),
+                "served": self._served[name],
+                "avg_wait_ms": round(self._waited[name] / self._served[name] * 1000, 1) if self._served[name] else 0.0,
+                "max_wait_ms": round(self._max_wait[name] * 1000, 1),
+            }
+            for name in PRIORITIES
+        }
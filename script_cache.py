@@ -0,0 +1,49 @@
+# script_cache.py
+import hashlib
+import types
+from typing import Dict, Iterable, Tuple
+
+# Dashboard scripts are bodies of this coroutine so top-level `await`/`return` work
+_WRAPPER = "async def _eval_coro(interaction, client, discord, app_commands):\n    {body}"
+
+# (command name, script hash) -> code. The name is part of the key because it is
+# compiled into the code objects (tracebacks, stall attribution)
+_cache: Dict[Tuple[str, str], types.CodeType] = {}
+
+
+def script_hash(script: str) -> str:
+    return hashlib.sha256(script.encode("utf-8")).hexdigest()
+
+
+def compile_script(script: str, name: str = "dynamic") -> types.CodeType:
+    """
+    Return the code object of the script's coroutine function, compiling it
+    only the first time this exact script is seen under this command name.
+    Raises SyntaxError (line numbers relative to the script) if it does not compile.
+    """
+    key = (name, script_hash(script))
+    code = _cache.get(key)
+    if code is None:
+        body = "\n    ".join(script.splitlines())
+        try:
+            module = compile(_WRAPPER.format(body=body), f"<command {name}>", "exec")
+        except SyntaxError as e:
+            if e.lineno:
+                e.lineno -= 1                  # don't count the wrapper line
+            raise
+        code = next(c for c in module.co_consts if isinstance(c, types.CodeType))
+        _cache[key] = code
+    return code
+
+
+def make_function(code: types.CodeType, namespace: dict) -> types.FunctionType:
+    """Bind a compiled script to *namespace* – no parsing or compiling involved."""
+    return types.FunctionType(code, namespace)
+
+
+def retain(commands: Iterable[Tuple[str, str]]) -> None:
+    """Drop cached code for (name, script) pairs that are no longer registered."""
+    live = {(name, script_hash(script)) for name, script in commands}
+    for key in list(_cache):
+        if key not in live:
+            del _cache[key]
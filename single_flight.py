@@ -0,0 +1,86 @@
+# single_flight.py
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+import metrics
+from request_scheduler import INTERACTIVE, PRIORITIES, current_priority
+
+
+def _rank(priority: str) -> int:
+    # Lower is more important; unknown names count as interactive, as in RequestScheduler.slot
+    return PRIORITIES.index(priority if priority in PRIORITIES else INTERACTIVE)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent lookups of the same key into one call to *fetch* and
+    keeps the result for *ttl* seconds.
+
+    The fetch runs as its own task and callers await it through shield(), so
+    one caller giving up (e.g. resolve_users hitting its deadline) doesn't
+    cancel it for everyone else. Failures are shared by the callers that were
+    waiting but never cached.
+
+    The task inherits its creator's request_priority, so a caller only joins
+    a flight of the same or a more important class; otherwise (an unban
+    lookup meeting a background name fetch) it starts its own.
+    """
+
+    def __init__(self, name: str, fetch: Callable[[Hashable], Awaitable[Any]], ttl: float = 30.0, max_size: int = 2000):
+        self.name = name
+        self._fetch = fetch
+        self.ttl = ttl
+        self.max_size = max_size
+        self._cache: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[Hashable, Tuple[asyncio.Task, str]] = {}     # key -> (task, priority)
+        self.hits = 0
+        self.merged = 0
+        self.fetches = 0
+
+    async def get(self, key: Hashable) -> Any:
+        entry = self._cache.get(key)
+        if entry is not None:
+            if entry[1] > time.monotonic():
+                self.hits += 1
+                metrics.FETCHES.inc(kind=self.name, outcome="cached")
+                return entry[0]
+            del self._cache[key]
+
+        priority = current_priority()
+        flight = self._inflight.get(key)
+        if flight is not None and _rank(flight[1]) <= _rank(priority):
+            task = flight[0]
+            self.merged += 1
+            metrics.FETCHES.inc(kind=self.name, outcome="merged")
+        else:
+            self.fetches += 1
+            metrics.FETCHES.inc(kind=self.name, outcome="fetched")
+            task = asyncio.ensure_future(self._fetch(key))
+            self._inflight[key] = (task, priority)
+            task.add_done_callback(lambda t, key=key: self._settle(key, t))
+        return await asyncio.shield(task)
+
+    def _settle(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key, (None,))[0] is task:     # a more important flight may have replaced it
+            del self._inflight[key]
+        if task.cancelled() or task.exception() is not None:   # reading it also marks it retrieved
+            return
+        if self.ttl > 0:
+            self._cache[key] = (task.result(), time.monotonic() + self.ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._cache.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "merged": self.merged,
+            "fetches": self.fetches,
+        }
@@ -0,0 +1,497 @@
+# sqlite_store.py
+"""
+Logs, appeals and custom commands in one SQLite database (WAL mode), for
+``"storage": "sqlite"``.
+
+Unlike the JSON files, the database can be written by several processes at
+once – the bot and any number of dashboard workers (see bot_ipc.py). Every
+write is one short BEGIN IMMEDIATE transaction that also bumps a row in the
+``versions`` table, so each process notices the others' changes with a
+single indexed read; that row is what version() reports to the page cache.
+
+A new database imports logs.jsonl (archive included), appeals.json and the
+custom commands from config.json the first time it is opened. The files are
+left where they are.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from persistence import get_worker
+from log_store import (LogStore, LogIndex, JsonlLogStore, LOGS_FILE, LEGACY_LOGS_FILE, UNDATED,
+                       month_of, _current_month, _shift_month, _record_id)
+
+DATABASE_FILE = "modbot.db"
+BATCH_SIZE = 500                # rows per query when streaming logs
+WRITE_RETRIES = 5               # attempts at a deferred log write before its entries are dumped to the error log
+RETRY_DELAY = 2.0               # seconds before the first retry, doubled after each failure
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    month TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS logs_month ON logs (month);
+CREATE TABLE IF NOT EXISTS appeals (
+    user_id TEXT NOT NULL,
+    log_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    thread_id TEXT,
+    appeal TEXT NOT NULL,
+    PRIMARY KEY (user_id, log_id)
+);
+CREATE INDEX IF NOT EXISTS appeals_seq ON appeals (seq);
+CREATE INDEX IF NOT EXISTS appeals_thread ON appeals (thread_id);
+CREATE TABLE IF NOT EXISTS commands (
+    name TEXT PRIMARY KEY,
+    script TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    name TEXT PRIMARY KEY,
+    changes INTEGER NOT NULL,
+    changed_at REAL NOT NULL
+);
+"""
+
+
+class Database:
+    """
+    One SQLite file, one connection per thread (and per process: a
+    connection inherited through fork() is never reused).
+    """
+
+    def __init__(self, path: str = DATABASE_FILE, busy_timeout: float = 10.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        conn = self.connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        now = time.time()
+        for name in ("logs", "appeals", "commands"):
+            conn.execute("INSERT OR IGNORE INTO versions (name, changes, changed_at) VALUES (?, 0, ?)", (name, now))
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # Autocommit; transaction() opens the write transactions explicitly
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """A write transaction. IMMEDIATE takes the write lock up front, so readers-turned-writers can't deadlock."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def query(self, sql: str, args: Tuple = ()) -> List[Tuple]:
+        return self.connection().execute(sql, args).fetchall()
+
+    def bump(self, conn: sqlite3.Connection, name: str) -> None:
+        """Record a change to *name*; call inside the transaction that made it."""
+        conn.execute("UPDATE versions SET changes = changes + 1, changed_at = ? WHERE name = ?", (time.time(), name))
+
+    def version(self, name: str) -> Tuple[int, float]:
+        rows = self.query("SELECT changes, changed_at FROM versions WHERE name = ?", (name,))
+        return rows[0] if rows else (0, 0.0)
+
+    def size_kb(self) -> int:
+        total = 0
+        for suffix in ("", "-wal"):
+            try:
+                total += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return total // 1024
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+
+_databases: Dict[str, Database] = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(path: str = DATABASE_FILE) -> Database:
+    """The process-wide Database for *path*."""
+    with _databases_lock:
+        database = _databases.get(path)
+        if database is None:
+            database = _databases[path] = Database(path)
+        return database
+
+
+def _is_new(conn: sqlite3.Connection, table: str, name: str) -> bool:
+    """True for a table that has never been written (so importing old files is safe)."""
+    if conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+        return False
+    return conn.execute("SELECT changes FROM versions WHERE name = ?", (name,)).fetchone()[0] == 0
+
+
+class SqliteLogStore(LogStore):
+    """
+    The log as one table keyed by id. get() and iter_newest() query it
+    directly; all()/for_user()/search use an in-memory LogIndex that is
+    rebuilt when the 'logs' version moves (appends from this process are
+    added to it in place). Nothing needs rotating; compact() applies the
+    retention and checkpoints the WAL.
+
+    Appends made on an event loop (add_log in a custom command script) are
+    written by the persistence thread, grouped into one transaction: BEGIN
+    IMMEDIATE can wait up to busy_timeout on another process's write lock,
+    and the bot loop mustn't. The records returned for them get their 'id'
+    once written; coroutines that need the id call add_logs through
+    asyncio.to_thread instead. A failed deferred write is retried
+    WRITE_RETRIES times, then its entries are written to the error log.
+    """
+
+    def __init__(self, database: Optional[Database] = None, import_path: str = LOGS_FILE,
+                 legacy_path: str = LEGACY_LOGS_FILE):
+        self.db = database or get_database()
+        self._lock = threading.RLock()
+        self._index: Optional[LogIndex] = None
+        self._index_version = None
+        self._pending: List[Dict] = []
+        self._pending_lock = threading.Lock()
+        self._failures = 0                  # consecutive failed deferred writes
+        self._import(import_path, legacy_path)
+
+    def _import(self, path: str, legacy_path: str) -> None:
+        if not os.path.exists(path) and not os.path.exists(legacy_path):
+            return
+        with self.db.transaction() as conn:
+            if not _is_new(conn, "logs", "logs"):
+                return
+            if os.path.exists(path):
+                records = list(JsonlLogStore(path, legacy_path=legacy_path).iter_newest())[::-1]
+            else:
+                try:
+                    with open(legacy_path, "r", encoding="utf-8") as f:
+                        records = list(reversed(json.load(f)))     # newest first
+                except Exception as e:
+                    logging.error(f"Could not import {legacy_path}: {e}")
+                    return
+            seen = set()
+            for record in records:
+                log_id = _record_id(record)
+                self._insert(conn, dict(record), None if log_id in seen else log_id)    # a duplicate gets a new id
+                seen.add(log_id)
+            self.db.bump(conn, "logs")
+        logging.info(f"Imported {len(records)} log entries into {self.db.path}")
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, record: Dict, log_id: Optional[int] = None) -> Dict:
+        """Insert *record* (the store's own copy) and set its 'id'."""
+        record.pop("id", None)
+        cursor = conn.execute(
+            "INSERT INTO logs (id, user_id, month, record) VALUES (?, ?, ?, ?)",
+            (log_id, str(record.get("user_id", "")), month_of(record) or UNDATED,
+             json.dumps(record, ensure_ascii=False)))
+        record["id"] = str(cursor.lastrowid)
+        return record
+
+    @staticmethod
+    def _record(row) -> Dict:
+        record = json.loads(row[1])
+        record["id"] = str(row[0])
+        return record
+
+    def _indexed(self) -> LogIndex:
+        version = self.version()
+        with self._lock:
+            if self._index is None or version != self._index_version:
+                rows = self.db.query("SELECT id, record FROM logs ORDER BY id")
+                self._index = LogIndex([self._record(row) for row in rows])
+                self._index_version = version
+            return self._index
+
+    # -- LogStore ---------------------------------------------------------
+
+    def append(self, entry: Dict) -> Dict:
+        return self.append_many([entry])[0]
+
+    def append_many(self, entries: List[Dict]) -> List[Dict]:
+        if not entries:
+            return []
+        records = [dict(entry) for entry in entries]      # copies so we don't mutate the caller's dicts
+        if not _on_event_loop():
+            return self._write(records)
+        with self._pending_lock:
+            first = not self._pending
+            self._pending.extend(records)
+        if first:
+            get_worker().run(self._write_pending)
+        return records
+
+    def _write_pending(self) -> None:
+        with self._pending_lock:
+            records, self._pending = self._pending, []
+        if not records:
+            return
+        try:
+            self._write(records)
+        except Exception as e:
+            for record in records:
+                record.pop("id", None)          # set by the rolled-back inserts
+            self._failures += 1
+            if self._failures > WRITE_RETRIES:
+                self._failures = 0
+                logging.error(f"Giving up on {len(records)} log entries after {WRITE_RETRIES} retries "
+                              f"({e}); they were not stored:")
+                for record in records:
+                    logging.error(json.dumps(record, ensure_ascii=False))
+                return
+            delay = RETRY_DELAY * 2 ** (self._failures - 1)
+            logging.error(f"Failed to store {len(records)} log entries ({e}); retrying in {delay:g}s")
+            with self._pending_lock:
+                self._pending[:0] = records     # ahead of anything appended meanwhile
+            timer = threading.Timer(delay, get_worker().run, (self._write_pending,))
+            timer.daemon = True
+            timer.start()
+            return
+        self._failures = 0
+
+    def _write(self, records: List[Dict]) -> List[Dict]:
+        with self._lock:
+            with self.db.transaction() as conn:
+                before = self.version()
+                for record in records:
+                    self._insert(conn, record)
+                self.db.bump(conn, "logs")
+                after = self.version()
+            # Nobody else wrote in between: keep the index instead of reloading it
+            if self._index is not None and before == self._index_version:
+                for record in records:
+                    self._index.add(record)
+                self._index_version = after
+        return records
+
+    def get(self, log_id: str) -> Optional[Dict]:
+        row_id = _record_id({"id": log_id})
+        if row_id is None:
+            return None
+        rows = self.db.query("SELECT id, record FROM logs WHERE id = ?", (row_id,))
+        return self._record(rows[0]) if rows else None
+
+    def all(self) -> List[Dict]:
+        return self._indexed().newest_first()
+
+    def for_user(self, user_id: str) -> List[Dict]:
+        return self._indexed().for_user(user_id)
+
+    def search_user_id(self, fragment: str) -> List[Dict]:
+        return self._indexed().search_user_id(fragment)
+
+    def search(self, query: str) -> List[Dict]:
+        return self._indexed().search(query)
+
+    def iter_newest(self, before: Optional[str] = None) -> Iterator[Dict]:
+        limit = _record_id({"id": before}) if before else None
+        while True:
+            if limit is None:
+                rows = self.db.query("SELECT id, record FROM logs ORDER BY id DESC LIMIT ?", (BATCH_SIZE,))
+            else:
+                rows = self.db.query("SELECT id, record FROM logs WHERE id < ? ORDER BY id DESC LIMIT ?",
+                                     (limit, BATCH_SIZE))
+            if not rows:
+                return
+            for row in rows:
+                yield self._record(row)
+            limit = rows[-1][0]
+
+    def compact(self, retention_months: int = 0, now: Optional[datetime] = None) -> Dict:
+        expired = []
+        if retention_months > 0:
+            cutoff = _shift_month(_current_month(now), -retention_months)
+            with self.db.transaction() as conn:
+                expired = [row[0] for row in conn.execute(
+                    "SELECT DISTINCT month FROM logs WHERE month < ? AND month != ? ORDER BY month",
+                    (cutoff, UNDATED))]
+                if expired:
+                    conn.execute("DELETE FROM logs WHERE month < ? AND month != ?", (cutoff, UNDATED))
+                    self.db.bump(conn, "logs")
+        conn = self.db.connection()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA optimize")
+        return dict(self.storage_stats(), archived_now=0, expired=expired)
+
+    def storage_stats(self) -> Dict:
+        count, oldest = self.db.query("SELECT COUNT(*), MIN(month) FROM logs")[0]
+        return {"engine": "sqlite", "hot": count, "archived": 0, "segments": 0, "oldest": oldest,
+                "size_kb": self.db.size_kb()}
+
+    def version(self) -> Tuple[int, float]:
+        return self.db.version("logs")
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _key(user_id, log_id) -> Tuple[str, str]:
+    return str(user_id), str(log_id)
+
+
+class SqliteAppealStore:
+    """
+    appeal_store.AppealStore on the shared database: same methods, same
+    newest-first order (an upsert moves the appeal to the top). Every
+    mutation is one transaction, so the bot and dashboard workers can't lose
+    each other's updates. BEGIN IMMEDIATE can wait up to busy_timeout for
+    another process's write lock, so code on the bot loop runs mutations
+    through asyncio.to_thread (see moderation.py).
+    """
+
+    def __init__(self, database: Optional[Database] = None, import_path: str = "appeals.json"):
+        self.db = database or get_database()
+        self._import(import_path)
+
+    def _import(self, path: str) -> None:
+        if not os.path.exists(path):
+            return
+        with self.db.transaction() as conn:
+            if not _is_new(conn, "appeals", "appeals"):
+                return
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    appeals = json.load(f)
+            except Exception as e:
+                logging.error(f"Could not import {path}: {e}")
+                return
+            for appeal in reversed(appeals):          # file is newest first
+                self._write(conn, appeal)
+            self.db.bump(conn, "appeals")
+        logging.info(f"Imported {len(appeals)} appeals into {self.db.path}")
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, appeal: Dict) -> None:
+        user_id, log_id = _key(appeal.get("user_id"), appeal.get("log_id"))
+        seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM appeals").fetchone()[0]
+        thread_id = str(appeal["thread_id"]) if appeal.get("thread_id") else None
+        conn.execute("INSERT OR REPLACE INTO appeals (user_id, log_id, seq, thread_id, appeal) VALUES (?, ?, ?, ?, ?)",
+                     (user_id, log_id, seq, thread_id, json.dumps(appeal, ensure_ascii=False)))
+
+    @staticmethod
+    def _fetch(conn: sqlite3.Connection, key: Tuple[str, str]) -> Optional[Dict]:
+        row = conn.execute("SELECT appeal FROM appeals WHERE user_id = ? AND log_id = ?", key).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # -- queries ----------------------------------------------------------
+
+    def version(self) -> Tuple[int, float]:
+        return self.db.version("appeals")
+
+    def all(self) -> List[Dict]:
+        """Every pending appeal, newest first."""
+        return [json.loads(row[0]) for row in self.db.query("SELECT appeal FROM appeals ORDER BY seq DESC")]
+
+    def get(self, user_id, log_id) -> Optional[Dict]:
+        return self._fetch(self.db.connection(), _key(user_id, log_id))
+
+    def get_by_thread(self, thread_id) -> Optional[Dict]:
+        rows = self.db.query("SELECT appeal FROM appeals WHERE thread_id = ?", (str(thread_id),))
+        return json.loads(rows[0][0]) if rows else None
+
+    # -- mutations --------------------------------------------------------
+
+    def upsert(self, appeal: Dict) -> Dict:
+        """Add an appeal, or merge it into the existing one (keeping thread_id etc.) and move that to the top."""
+        with self.db.transaction() as conn:
+            existing = self._fetch(conn, _key(appeal.get("user_id"), appeal.get("log_id")))
+            appeal = dict(existing or {}, **appeal)
+            self._write(conn, appeal)
+            self.db.bump(conn, "appeals")
+        return dict(appeal)
+
+    def update(self, user_id, log_id, **fields) -> Optional[Dict]:
+        """Set *fields* on an existing appeal in place. Returns None if there is no such appeal."""
+        key = _key(user_id, log_id)
+        with self.db.transaction() as conn:
+            appeal = self._fetch(conn, key)
+            if appeal is None:
+                return None
+            appeal.update(fields)
+            thread_id = str(appeal["thread_id"]) if appeal.get("thread_id") else None
+            conn.execute("UPDATE appeals SET thread_id = ?, appeal = ? WHERE user_id = ? AND log_id = ?",
+                         (thread_id, json.dumps(appeal, ensure_ascii=False)) + key)
+            self.db.bump(conn, "appeals")
+        return appeal
+
+    def delete(self, user_id, log_id) -> Optional[Dict]:
+        """Remove an appeal. Returns the removed appeal, or None if it didn't exist."""
+        return self.delete_many([(user_id, log_id)])[0]
+
+    def delete_many(self, keys: List[Tuple]) -> List[Optional[Dict]]:
+        """Remove several (user_id, log_id) appeals in one transaction. Results follow *keys*."""
+        removed = []
+        with self.db.transaction() as conn:
+            for user_id, log_id in keys:
+                key = _key(user_id, log_id)
+                appeal = self._fetch(conn, key)
+                if appeal is not None:
+                    conn.execute("DELETE FROM appeals WHERE user_id = ? AND log_id = ?", key)
+                removed.append(appeal)
+            if any(r is not None for r in removed):
+                self.db.bump(conn, "appeals")
+        return removed
+
+
+class SqliteCommandStore:
+    """Custom command scripts by name, for ConfigService.use_command_store(). Writes block like SqliteAppealStore's."""
+
+    def __init__(self, database: Optional[Database] = None, initial: Optional[Dict[str, str]] = None):
+        self.db = database or get_database()
+        if initial:
+            self._import(initial)
+
+    def _import(self, commands: Dict[str, str]) -> None:
+        with self.db.transaction() as conn:
+            if not _is_new(conn, "commands", "commands"):
+                return
+            conn.executemany("INSERT INTO commands (name, script) VALUES (?, ?)", commands.items())
+            self.db.bump(conn, "commands")
+        logging.info(f"Imported {len(commands)} custom commands into {self.db.path}")
+
+    def all(self) -> Dict[str, str]:
+        return dict(self.db.query("SELECT name, script FROM commands ORDER BY rowid"))
+
+    def set(self, name: str, script: str, replaces: Optional[str] = None) -> None:
+        with self.db.transaction() as conn:
+            if replaces is not None and replaces != name:
+                conn.execute("DELETE FROM commands WHERE name = ?", (replaces,))
+            conn.execute("INSERT INTO commands (name, script) VALUES (?, ?) "
+                         "ON CONFLICT (name) DO UPDATE SET script = excluded.script", (name, script))
+            self.db.bump(conn, "commands")
+
+    def delete(self, name: str) -> bool:
+        with self.db.transaction() as conn:
+            deleted = conn.execute("DELETE FROM commands WHERE name = ?", (name,)).rowcount > 0
+            if deleted:
+                self.db.bump(conn, "commands")
+        return deleted
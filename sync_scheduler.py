@@ -0,0 +1,112 @@
+# sync_scheduler.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+SYNC_STATE_FILE = "sync_state.json"
+
+
+class SyncScheduler:
+    """
+    Coalesces command tree syncs.
+    Dashboard edits call request(); the actual tree.sync() runs once the edits
+    have been quiet for *delay* seconds (or *max_delay* after the first one),
+    and is skipped entirely when the serialized commands match the last sync.
+    """
+
+    def __init__(self, bot, delay: float = 5.0, max_delay: float = 30.0, state_file: str = SYNC_STATE_FILE):
+        self.bot = bot
+        self.delay = delay
+        self.max_delay = max_delay
+        self.state_file = state_file
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._first_request: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self.pending = False
+        self.last_result = None
+        self.last_run = None
+        self.fingerprint = self._load_fingerprint()
+
+    # -- persistence ------------------------------------------------------
+
+    def _load_fingerprint(self) -> Optional[str]:
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(f).get("fingerprint")
+        except (OSError, ValueError):
+            return None
+
+    def _save_fingerprint(self) -> None:
+        tmp = self.state_file + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"fingerprint": self.fingerprint, "synced_at": self.last_run}, f)
+            os.replace(tmp, self.state_file)
+        except OSError as e:
+            logging.error(f"Error saving sync state: {e}")
+
+    def compute_fingerprint(self) -> str:
+        tree = self.bot.tree
+        payloads = []
+        for command in tree.get_commands():
+            try:
+                payloads.append(command.to_dict(tree))
+            except TypeError:                  # discord.py < 2.4
+                payloads.append(command.to_dict())
+        payloads.sort(key=lambda p: (p.get("type", 1), p.get("name", "")))
+        blob = json.dumps({"app": self.bot.application_id, "commands": payloads}, sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    # -- scheduling -------------------------------------------------------
+
+    def request(self) -> None:
+        """Ask for a sync. Safe to call from any thread."""
+        self.pending = True
+        self.bot.loop.call_soon_threadsafe(self._schedule)
+
+    def _schedule(self) -> None:
+        now = time.monotonic()
+        if self._first_request is None:
+            self._first_request = now
+        if self._handle is not None:
+            self._handle.cancel()
+        wait = min(self.delay, max(0.0, self._first_request + self.max_delay - now))
+        self._handle = self.bot.loop.call_later(wait, lambda: asyncio.ensure_future(self._fire()))
+
+    async def _fire(self) -> None:
+        self._handle = None
+        self._first_request = None
+        await self.sync_now()
+
+    async def sync_now(self, force: bool = False) -> bool:
+        """Sync immediately unless nothing changed. Returns True if Discord was called."""
+        async with self._lock:
+            self.pending = False
+            self.last_run = time.time()
+            fingerprint = self.compute_fingerprint()
+            if not force and fingerprint == self.fingerprint:
+                self.last_result = "skipped (no changes)"
+                logging.info("Command tree unchanged, skipping sync")
+                return False
+            try:
+                await self.bot.tree.sync()
+            except Exception as e:
+                self.last_result = f"error: {e}"
+                logging.error(f"Command tree sync failed: {e}")
+                return False
+            self.fingerprint = fingerprint
+            self.last_result = "synced"
+            self._save_fingerprint()
+            return True
+
+    def status(self) -> dict:
+        return {
+            "pending": self.pending,
+            "last_result": self.last_result,
+            "last_run": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.last_run)) if self.last_run else None,
+            "fingerprint": (self.fingerprint or "")[:12],
+        }
@@ -0,0 +1,128 @@
+# user_cache.py
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+USER_CACHE_FILE = "user_cache.json"
+
+
+class UserCache:
+    """
+    Bounded LRU of user_id -> username with per-entry expiry.
+    A cached None means "this id 404'd" (negative entry) and expires sooner.
+    Expiry uses wall-clock time so a snapshot stays valid across restarts.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 24 * 3600, negative_ttl: float = 3600,
+                 on_evict: Optional[Callable[[int], None]] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.on_evict = on_evict                   # called (outside the lock) with ids evicted or expired
+        self._entries: "OrderedDict[int, Tuple[Optional[str], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, user_id: int) -> Tuple[bool, Optional[str]]:
+        """Return (found, username); a found None is a negative entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            name, expires_at = entry
+            if expires_at > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return True, name
+            del self._entries[user_id]
+            self.expirations += 1
+            self.misses += 1
+        if self.on_evict:
+            self.on_evict(user_id)
+        return False, None
+
+    def put(self, user_id: int, name: str) -> None:
+        self._put(user_id, name, self.ttl)
+
+    def put_missing(self, user_id: int) -> None:
+        self._put(user_id, None, self.negative_ttl)
+
+    def _put(self, user_id: int, name: Optional[str], ttl: float) -> None:
+        evicted = []
+        with self._lock:
+            self._entries[user_id] = (name, time.time() + ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                evicted.append(self._entries.popitem(last=False)[0])
+                self.evictions += 1
+        if self.on_evict:
+            for uid in evicted:
+                self.on_evict(uid)
+
+    def __contains__(self, user_id: int) -> bool:
+        entry = self._entries.get(user_id)
+        return entry is not None and entry[1] > time.time()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def names(self) -> Dict[int, str]:
+        """Every live, positive entry as {user_id: username}."""
+        now = time.time()
+        with self._lock:
+            return {uid: name for uid, (name, exp) in self._entries.items() if name and exp > now}
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    # -- snapshots --------------------------------------------------------
+
+    def save(self, path: str = USER_CACHE_FILE) -> None:
+        """Write live entries (least recently used first) to *path* atomically."""
+        now = time.time()
+        with self._lock:
+            entries = [[uid, name, exp] for uid, (name, exp) in self._entries.items() if exp > now]
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logging.error(f"Error saving user cache: {e}")
+
+    def load(self, path: str = USER_CACHE_FILE) -> None:
+        """Warm the cache from a snapshot written by save(); expired entries are skipped."""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except Exception as e:
+            logging.error(f"Error loading user cache: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for uid, name, exp in entries:
+                if exp > now:
+                    self._entries[int(uid)] = (name, exp)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        logging.info(f"Loaded {len(self._entries)} cached usernames")